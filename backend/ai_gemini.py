@@ -109,7 +109,11 @@ def _extract_text_from_gemini_response(resp_json: Dict) -> str:
             texts.append(t)
     return "\n".join(texts).strip()
 
-def build_outfit_prompt(feedbacks: List[Dict], today_env: Dict) -> str:
+def build_outfit_prompt(
+    feedbacks: List[Dict],
+    today_env: Dict,
+    ranked_outfits: Optional[List[Dict]] = None,
+) -> str:
     """
     產生給 Gemini 使用的「穿搭建議」 Prompt。
     feedbacks: 最近幾次使用者的 feedback（包含穿搭、體感、環境）
@@ -120,6 +124,7 @@ def build_outfit_prompt(feedbacks: List[Dict], today_env: Dict) -> str:
         "weatherDesc": ...,
         "aqi": ...
     }
+    ranked_outfits: comfort_model.rank_outfits 的結果（可省略）
     """
 
     t_min = today_env.get("tempMin")
@@ -186,6 +191,15 @@ def build_outfit_prompt(feedbacks: List[Dict], today_env: Dict) -> str:
 
     history_block = "\n".join(history_lines) if history_lines else "No previous outfit feedback records."
 
+    # ===== 使用者體感模型的排名（predictedFeel 越接近 0 越舒適）=====
+    ranked_lines = []
+    for r in ranked_outfits or []:
+        ranked_lines.append(
+            f"- top={r.get('top')}, outer={r.get('outer')}, bottom={r.get('bottom')}; "
+            f"predicted_feel={r.get('predictedFeel')}"
+        )
+    ranked_block = "\n".join(ranked_lines) if ranked_lines else "No comfort model ranking available."
+
     prompt = f"""
     You are an outfit recommendation assistant for a weather and allergy-aware dashboard.
 
@@ -202,6 +216,9 @@ def build_outfit_prompt(feedbacks: List[Dict], today_env: Dict) -> str:
     User outfit & comfort history:
     {history_block}
 
+    Comfort model ranking for today (predicted_feel: -1 = very cold, 0 = just right, +1 = very hot):
+    {ranked_block}
+
     Today's environment:
     - Min temperature: {t_min} °C
     - Max temperature: {t_max} °C
@@ -223,6 +240,7 @@ def build_outfit_prompt(feedbacks: List[Dict], today_env: Dict) -> str:
     - No additional explanations
     - Each line MUST be exactly one item or one short sentence.
     - Use the history patterns to avoid repeating outfits that made the user feel too cold or too hot.
+    - Prefer outfits close to the comfort model ranking unless the history clearly suggests otherwise.
     - If AQI is high and the user had bad allergy impact before, mention protection or more indoor-friendly ideas.
     """
 
@@ -0,0 +1,256 @@
+# allergy_analytics.py
+"""
+全體使用者的過敏統計：allergyImpact / allergySymptoms 與 AQI 等級、溫差的關係。
+
+用 Mongo aggregation pipeline 在資料庫端依（測站, 週, AQI 等級, 溫差等級）分組，
+結果 $merge 進 allergy_analytics；API 只讀這份 summary，不掃原始 feedback。
+每格存的是可加總的 sum（n、Σimpact、Σaqi·impact…），查詢時任意合併後再算平均與相關係數。
+
+用法：
+    python allergy_analytics.py        # 手動重算一次（可掛 cron）
+"""
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+import math
+import threading
+import time
+
+from mongo import claim_run
+
+# 每次重算最近幾週（更早的格子保留上次結果）
+ANALYTICS_WEEKS = 26
+SUMMARY_COLLECTION = "allergy_analytics"
+
+# 與前端 getAqiCategory 相同的分級
+AQI_BANDS = [
+    (50, "good"),
+    (100, "moderate"),
+    (150, "usg"),
+    (200, "unhealthy"),
+    (300, "very"),
+]
+# 今日溫差（envTempDiff）分級
+SWING_BANDS = [
+    (5, "small"),
+    (10, "medium"),
+]
+
+GROUP_FIELDS = ("site", "week", "aqiBand", "swingBand")
+
+# week 存的是台灣時間週一 00:00 對應的 UTC 時刻（$dateTrunc timezone +08:00）
+TAIPEI_OFFSET = timedelta(hours=8)
+
+
+def _band_switch(field: str, bands, last: str) -> Dict:
+    return {
+        "$switch": {
+            "branches": [{"case": {"$eq": [field, None]}, "then": "unknown"}] + [
+                {"case": {"$lte": [field, limit]}, "then": name}
+                for limit, name in bands
+            ],
+            "default": last,
+        }
+    }
+
+
+def build_allergy_pipeline(since: datetime, computed_at: datetime) -> List[Dict]:
+    """feedback → 每個（測站, 週, AQI 等級, 溫差等級）一筆可加總的統計，$merge 進 summary"""
+    aqi = {"$convert": {"input": "$envAqi", "to": "double", "onError": None, "onNull": None}}
+    diff = {"$convert": {"input": "$envTempDiff", "to": "double", "onError": None, "onNull": None}}
+    impact = {"$convert": {"input": "$allergyImpact", "to": "double", "onError": 0, "onNull": 0}}
+
+    return [
+        {"$match": {"createdAt": {"$gte": since}}},
+        {"$project": {
+            "site": {"$ifNull": ["$envAqiSite", ""]},
+            "week": {"$dateTrunc": {
+                "date": "$createdAt", "unit": "week",
+                "timezone": "+08:00", "startOfWeek": "monday",
+            }},
+            "aqi": aqi,
+            "diff": diff,
+            "impact": impact,
+            "severe": {"$cond": [{"$eq": ["$allergyFeel", "severe"]}, 1, 0]},
+            "symptoms": {"$ifNull": ["$allergySymptoms", []]},
+        }},
+        {"$addFields": {
+            "aqiBand": _band_switch("$aqi", AQI_BANDS, "hazardous"),
+            "swingBand": _band_switch("$diff", SWING_BANDS, "large"),
+            # 相關係數只用兩邊都有值的紀錄
+            "hasAqi": {"$cond": [{"$eq": ["$aqi", None]}, 0, 1]},
+            "hasDiff": {"$cond": [{"$eq": ["$diff", None]}, 0, 1]},
+        }},
+        {"$group": {
+            "_id": {f: f"${f}" for f in GROUP_FIELDS},
+            "n": {"$sum": 1},
+            "severe": {"$sum": "$severe"},
+            "impactSum": {"$sum": "$impact"},
+            "impactSq": {"$sum": {"$multiply": ["$impact", "$impact"]}},
+            "aqiN": {"$sum": "$hasAqi"},
+            "aqiSum": {"$sum": {"$ifNull": ["$aqi", 0]}},
+            "aqiSq": {"$sum": {"$multiply": [{"$ifNull": ["$aqi", 0]}, {"$ifNull": ["$aqi", 0]}]}},
+            "aqiImpact": {"$sum": {"$multiply": [{"$ifNull": ["$aqi", 0]}, "$impact"]}},
+            "aqiImpactSum": {"$sum": {"$multiply": ["$hasAqi", "$impact"]}},
+            "aqiImpactSq": {"$sum": {"$multiply": ["$hasAqi", "$impact", "$impact"]}},
+            "diffN": {"$sum": "$hasDiff"},
+            "diffSum": {"$sum": {"$ifNull": ["$diff", 0]}},
+            "diffSq": {"$sum": {"$multiply": [{"$ifNull": ["$diff", 0]}, {"$ifNull": ["$diff", 0]}]}},
+            "diffImpact": {"$sum": {"$multiply": [{"$ifNull": ["$diff", 0]}, "$impact"]}},
+            "diffImpactSum": {"$sum": {"$multiply": ["$hasDiff", "$impact"]}},
+            "diffImpactSq": {"$sum": {"$multiply": ["$hasDiff", "$impact", "$impact"]}},
+            "symptomLists": {"$push": "$symptoms"},
+        }},
+        # 症狀攤平後計次：{"sneezing": 3, "itchy_eyes": 1}
+        {"$addFields": {
+            "allSymptoms": {"$reduce": {
+                "input": "$symptomLists", "initialValue": [],
+                "in": {"$concatArrays": ["$$value", "$$this"]},
+            }},
+        }},
+        {"$project": {
+            **{f: f"$_id.{f}" for f in GROUP_FIELDS},
+            "n": 1, "severe": 1, "impactSum": 1, "impactSq": 1,
+            "aqiN": 1, "aqiSum": 1, "aqiSq": 1, "aqiImpact": 1, "aqiImpactSum": 1, "aqiImpactSq": 1,
+            "diffN": 1, "diffSum": 1, "diffSq": 1, "diffImpact": 1, "diffImpactSum": 1, "diffImpactSq": 1,
+            "symptoms": {"$arrayToObject": {"$map": {
+                "input": {"$setUnion": ["$allSymptoms", []]},
+                "as": "s",
+                "in": {
+                    "k": {"$toString": "$$s"},
+                    "v": {"$size": {"$filter": {
+                        "input": "$allSymptoms", "cond": {"$eq": ["$$this", "$$s"]},
+                    }}},
+                },
+            }}},
+            "computedAt": {"$literal": computed_at},
+        }},
+        {"$merge": {"into": SUMMARY_COLLECTION, "on": "_id", "whenMatched": "replace"}},
+    ]
+
+
+def refresh_allergy_analytics(feedback_col, summary_col, weeks: int = ANALYTICS_WEEKS) -> datetime:
+    """重算最近 weeks 週的統計，並刪掉這段時間內已經沒有資料的舊格子"""
+    computed_at = datetime.utcnow()
+    # 對齊到台灣時間的週一 00:00（與 pipeline 分週一致），避免最早那週只算到一部分
+    local = computed_at + TAIPEI_OFFSET - timedelta(weeks=weeks)
+    local_monday = datetime(local.year, local.month, local.day) - timedelta(days=local.weekday())
+    since = local_monday - TAIPEI_OFFSET
+
+    list(feedback_col.aggregate(build_allergy_pipeline(since, computed_at), allowDiskUse=True))
+    summary_col.delete_many({"week": {"$gte": since}, "computedAt": {"$lt": computed_at}})
+    return computed_at
+
+
+def ensure_analytics_indexes(summary_col) -> None:
+    summary_col.create_index([("site", 1), ("week", 1)])
+
+
+# ========== 排程（多個 worker 也只會有一個實際執行）==========
+
+def start_analytics_scheduler(db, interval_sec: int) -> threading.Thread:
+    """背景 thread：每 interval_sec 秒重算一次統計"""
+    def loop():
+        while True:
+            try:
+                if claim_run(db["analytics_runs"], "allergy", interval_sec):
+                    refresh_allergy_analytics(db["feedback"], db[SUMMARY_COLLECTION])
+            except Exception as e:
+                print("allergy analytics error:", repr(e))
+            time.sleep(min(interval_sec, 300))
+
+    t = threading.Thread(target=loop, name="allergy-analytics", daemon=True)
+    t.start()
+    return t
+
+
+# ========== 查詢（合併 summary 格子）==========
+
+def _pearson(n, sx, sy, sxx, syy, sxy) -> Optional[float]:
+    if n < 3:
+        return None
+    cov = n * sxy - sx * sy
+    var = (n * sxx - sx * sx) * (n * syy - sy * sy)
+    if var <= 0:
+        return None
+    return round(cov / math.sqrt(var), 3)
+
+
+def _finish(acc: Dict) -> Dict:
+    n = acc["n"]
+    top = sorted(acc["symptoms"].items(), key=lambda kv: -kv[1])[:5]
+    return {
+        "n": n,
+        "avgImpact": round(acc["impactSum"] / n, 2) if n else None,
+        "severeRate": round(acc["severe"] / n, 3) if n else None,
+        "corrImpactAqi": _pearson(
+            acc["aqiN"], acc["aqiSum"], acc["aqiImpactSum"],
+            acc["aqiSq"], acc["aqiImpactSq"], acc["aqiImpact"],
+        ),
+        "corrImpactTempDiff": _pearson(
+            acc["diffN"], acc["diffSum"], acc["diffImpactSum"],
+            acc["diffSq"], acc["diffImpactSq"], acc["diffImpact"],
+        ),
+        "topSymptoms": [{"symptom": k, "count": v} for k, v in top],
+    }
+
+
+_SUM_FIELDS = (
+    "n", "severe", "impactSum", "impactSq",
+    "aqiN", "aqiSum", "aqiSq", "aqiImpact", "aqiImpactSum", "aqiImpactSq",
+    "diffN", "diffSum", "diffSq", "diffImpact", "diffImpactSum", "diffImpactSq",
+)
+
+
+def query_allergy_analytics(
+    summary_col,
+    group_by: str,
+    site: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Dict:
+    """
+    依 group_by（site / week / aqiBand / swingBand）合併 summary 格子。
+    since / until 是台灣時間的日期；week 的 key 也以台灣時間的週一表示。
+    回傳 {"overall": {...}, "groups": [{"key": ..., ...}]}
+    """
+    query: Dict = {}
+    if site:
+        query["site"] = site
+    if since or until:
+        query["week"] = {}
+        if since:
+            query["week"]["$gte"] = since - TAIPEI_OFFSET
+        if until:
+            query["week"]["$lte"] = until - TAIPEI_OFFSET
+
+    def empty():
+        return {**{f: 0 for f in _SUM_FIELDS}, "symptoms": {}}
+
+    overall = empty()
+    groups: Dict = {}
+    for cell in summary_col.find(query, {"_id": 0}):
+        key = cell.get(group_by)
+        if isinstance(key, datetime):
+            key = (key + TAIPEI_OFFSET).strftime("%Y-%m-%d")
+        for acc in (overall, groups.setdefault(key, empty())):
+            for f in _SUM_FIELDS:
+                acc[f] += cell.get(f, 0)
+            for s, c in (cell.get("symptoms") or {}).items():
+                acc["symptoms"][s] = acc["symptoms"].get(s, 0) + c
+
+    return {
+        "overall": _finish(overall) if overall["n"] else None,
+        "groups": [{"key": k, **_finish(groups[k])} for k in sorted(groups, key=str)],
+    }
+
+
+if __name__ == "__main__":
+    import os
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_URI"))["BreezyDay"]
+    ensure_analytics_indexes(db[SUMMARY_COLLECTION])
+    at = refresh_allergy_analytics(db["feedback"], db[SUMMARY_COLLECTION])
+    print("allergy analytics refreshed at", at.isoformat())
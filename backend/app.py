@@ -1,21 +1,46 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS, cross_origin
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import (
     JWTManager, create_access_token,
     jwt_required, get_jwt_identity
 )
-from pymongo import MongoClient, errors
+from pymongo import errors
 from bson import ObjectId
 from datetime import timedelta, datetime
 from dotenv import load_dotenv
 import os
-import requests
 import math
+
+# 要在 import 本地模組之前載入 .env（部分模組在 import / 建構時讀設定）
+load_dotenv()
+
 from datetime import timedelta, datetime, timezone
 from ai_gemini import build_allergy_prompt, call_gemini, build_outfit_prompt
-from requests.exceptions import HTTPError
-load_dotenv()
+from gemini_pool import GeminiKeyPool, PoolSaturated
+from comfort_model import model_inc_update, rank_outfits, outfit_from_ranking
+from history_store import (
+    ensure_history_indexes, HistoryIngester, start_compaction_scheduler,
+    query_history, parse_range_args, default_step, STEP_SECONDS,
+)
+from allergy_analytics import (
+    ensure_analytics_indexes, start_analytics_scheduler, query_allergy_analytics,
+    SUMMARY_COLLECTION, GROUP_FIELDS,
+)
+from township_forecast import (
+    ensure_township_indexes, start_township_scheduler, query_hourly, summarize_hours,
+    TOWNSHIP_COLLECTION, TAIPEI_TZ,
+)
+from env_stream import Broker, SnapshotWatcher, stream_events
+from mongo import LazyDatabase, on_warm_up, start_warm_up, readiness
+from shared_snapshot import make_env_snapshot
+from town_risk import TownRiskGrid
+from static_publisher import start_publisher
+from env_snapshot import (
+    fetch_aqi_payload, fetch_county_forecasts,
+    today_forecast, resolve_feedback_env, normalize_county,
+)
+from requests.exceptions import HTTPError, Timeout, ConnectionError as RequestsConnectionError
 
 app = Flask(__name__)
 
@@ -42,18 +67,82 @@ app.config["CWA_API_KEY"] = os.getenv("CWA_API_KEY", "dev_secret")
 bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
 
-# ===== 連線 MongoDB Atlas =====
-mongo_client = MongoClient(os.getenv("MONGO_URI"))
-db = mongo_client["BreezyDay"]
+# ===== 連線 MongoDB Atlas（延遲連線，import 時不碰網路）=====
+db = LazyDatabase("BreezyDay")
 users_col = db["users"]
 feedback_col = db["feedback"]
 ai_suggestions_col = db["ai_suggestions"]
+env_history_col = db["env_history"]
+allergy_analytics_col = db[SUMMARY_COLLECTION]
+township_forecast_col = db[TOWNSHIP_COLLECTION]
+
+@on_warm_up
+def provision_indexes():
+    # 確保 email unique
+    try:
+        users_col.create_index("email", unique=True)
+    except errors.OperationFailure:
+        pass
+
+    # AQI / 預報歷史 bucket 的唯一鍵與 TTL
+    try:
+        ensure_history_indexes(env_history_col)
+        ensure_analytics_indexes(allergy_analytics_col)
+        ensure_township_indexes(township_forecast_col)
+    except errors.OperationFailure:
+        pass
+
+
+# 背景連線 + 建 index，/health 不用等它
+start_warm_up()
+
+# 過敏統計排程（預設每小時重算，設 0 關閉，改用 cron 跑 allergy_analytics.py）
+analytics_refresh_sec = int(os.getenv("ANALYTICS_REFRESH_SEC", "3600"))
+if analytics_refresh_sec > 0:
+    start_analytics_scheduler(db, analytics_refresh_sec)
+
+# 歷史資料壓縮（逐時 → 每日 summary）間隔，0 = 關閉
+history_compact_sec = int(os.getenv("HISTORY_COMPACT_SEC", "86400"))
+if history_compact_sec > 0:
+    start_compaction_scheduler(db, env_history_col, history_compact_sec)
+
+# 鄉鎮逐時預報（F-D0047-089）更新間隔，0 = 關閉（改用 cron 跑 township_forecast.py）
+township_refresh_sec = int(os.getenv("TOWNSHIP_REFRESH_SEC", "3600"))
+if township_refresh_sec > 0 and os.getenv("CWA_API_KEY"):
+    start_township_scheduler(db, os.getenv("CWA_API_KEY"), township_refresh_sec)
 
-# 確保 email unique
-try:
-    users_col.create_index("email", unique=True)
-except errors.OperationFailure:
-    pass
+
+# ===== 上游 AQI / 預報快照（in-memory）=====
+def _fetch_aqi():
+    api_key = os.getenv("AQI_API_KEY")
+    if not api_key:
+        raise RuntimeError("後端未設定 AQI_API_KEY")
+    base_url = os.getenv("AQI_API_URL", "https://data.moenv.gov.tw/api/v2/aqx_p_432")
+    return fetch_aqi_payload(api_key, base_url)
+
+
+def _fetch_forecasts():
+    return fetch_county_forecasts(app.config.get("CWA_API_KEY"))
+
+
+# Linux（gunicorn 多 worker）用 mmap 共享快照，只有一個 worker 會打上游
+env_snapshot = make_env_snapshot(_fetch_aqi, _fetch_forecasts)
+
+# 每次快照更新就寫進歷史資料（背景 thread 寫，觸發 refresh 的 request 不等 Mongo）
+history_ingester = HistoryIngester(env_history_col)
+env_snapshot.on_aqi_refresh(history_ingester.submit_aqi)
+env_snapshot.on_forecast_refresh(history_ingester.submit_forecasts)
+
+# SSE 推播：每個 worker 一個 watcher，第一個訂閱者連上時才啟動
+env_watcher = SnapshotWatcher(env_snapshot, Broker())
+
+# 鄉鎮 IDW 風險格網：快照版本變了才重算
+town_risk_grid = TownRiskGrid(env_snapshot)
+
+# 靜態縣市快照（給 nginx / CDN 直接服務），有設 PUBLISH_DIR 才啟動
+publish_dir = os.getenv("PUBLISH_DIR")
+if publish_dir:
+    start_publisher(env_snapshot, publish_dir, town_risk_grid)
 
 
 def user_to_dict(doc):
@@ -132,24 +221,117 @@ def me():
 
 # ========== AQI Proxy API (保護你的私人金鑰) ==========
 
+AQI_CHUNK_BYTES = 64 * 1024
+
 @app.get("/api/aqi")
 def get_aqi():
-    """安全後端 Proxy，前端永遠不會看到 API key"""
-    api_key = os.getenv("AQI_API_KEY")
-    base_url = os.getenv("AQI_API_URL", "https://data.moenv.gov.tw/api/v2/aqx_p_432")
+    """安全後端 Proxy，前端永遠不會看到 API key（回傳快照，過期才打上游）"""
+    if not os.getenv("AQI_API_KEY"):
+        return jsonify({"error": "後端未設定 AQI_API_KEY"}), 500
 
-    if not api_key:
+    body = env_snapshot.get_aqi_json()
+    if body is None:
+        return jsonify({"error": "取得 AQI 失敗"}), 500
+
+    # 共享快照回傳的是 mmap 上的 memoryview：分段送出，不在每個 request 複製整份 JSON
+    view = memoryview(body)
+    chunks = (bytes(view[i: i + AQI_CHUNK_BYTES]) for i in range(0, len(view), AQI_CHUNK_BYTES))
+    return Response(chunks, mimetype="application/json", headers={"Content-Length": str(len(view))})
+
+
+@app.get("/api/aqi/town")
+def get_town_risk():
+    """
+    鄉鎮的 AQI 估計值與過敏風險（所有測站反距離加權）
+    ?city=臺北市&district=中山區；不帶參數回傳全部鄉鎮
+    """
+    if not os.getenv("AQI_API_KEY"):
         return jsonify({"error": "後端未設定 AQI_API_KEY"}), 500
 
-    url = f"{base_url}?api_key={api_key}&format=json"
+    city = request.args.get("city")
+    district = request.args.get("district")
+    if not city and not district:
+        return jsonify({"success": True, "towns": town_risk_grid.all()})
+    if not city or not district:
+        return jsonify({"success": False, "error": "Missing city or district"}), 400
 
-    try:
-        resp = requests.get(url, timeout=8)
-        resp.raise_for_status()
-        return jsonify(resp.json())
-    except Exception as e:
-        print("AQI API 錯誤:", e)
-        return jsonify({"error": "取得 AQI 失敗"}), 500
+    town = town_risk_grid.lookup(city, district)
+    if town is None:
+        return jsonify({"success": False, "error": f"Unknown town: {city} {district}"}), 404
+    return jsonify({"success": True, **town})
+
+
+@app.get("/api/stream")
+def stream_env_updates():
+    """
+    Server-Sent Events：訂閱測站 AQI / 縣市今日預報，只在數值變動時推送
+    ?stations=中山,板橋&counties=臺北市（stations=* 訂閱全部測站）
+    事件：event: station（測站讀數）、event: county（today-range 同格式）
+    """
+    stations = [s.strip().split(" ")[-1] for s in request.args.get("stations", "").split(",") if s.strip()]
+    counties = [normalize_county(c) for c in request.args.get("counties", "").split(",") if c.strip()]
+    topics = [f"station:{s}" for s in stations] + [f"county:{c}" for c in counties]
+    if not topics:
+        return jsonify({"success": False, "error": "Missing stations or counties"}), 400
+    if len(topics) > 50:
+        return jsonify({"success": False, "error": "Too many topics (max 50)"}), 400
+
+    return Response(
+        stream_events(env_watcher, topics),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # nginx 不要 buffer
+        },
+    )
+
+
+def _history_response(kind: str, key: str):
+    """/api/aqi/history 與 /api/weather/history 共用的 from/to/step 解析與查詢"""
+    rng = parse_range_args(request.args.get("from"), request.args.get("to"))
+    if rng is None:
+        return jsonify({
+            "success": False,
+            "error": "Invalid from/to (use YYYY-MM-DD or YYYY-MM-DD HH:MM)"
+        }), 400
+    start, end = rng
+
+    if end - start > timedelta(days=400):
+        return jsonify({
+            "success": False,
+            "error": "Range too long (max 400 days)"
+        }), 400
+
+    step = request.args.get("step") or default_step(start, end)
+    if step not in STEP_SECONDS:
+        return jsonify({
+            "success": False,
+            "error": f"Invalid step, use one of {', '.join(STEP_SECONDS)}"
+        }), 400
+
+    points = query_history(env_history_col, kind, key, start, end, step)
+    return jsonify({
+        "success": True,
+        "key": key,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "step": step,
+        "points": points,
+    })
+
+
+@app.get("/api/aqi/history")
+def get_aqi_history():
+    """
+    單一測站的 AQI / PM2.5 / PM10 / O3 歷史
+    ?site=中山&from=2025-11-01&to=2025-12-01&step=6h
+    site 也接受前端的「縣市 測站」格式（如「臺北市 中山」）
+    """
+    site = (request.args.get("site") or "").strip()
+    if not site:
+        return jsonify({"success": False, "error": "Missing site"}), 400
+    site = site.split(" ")[-1]
+    return _history_response("aqi", site)
 
 
 # ========== Profile APIs ==========
@@ -210,6 +392,13 @@ def submit_feedback():
 
     data = request.get_json() or {}
 
+    # 環境欄位一律由後端依測站 / 縣市從快照算（不打上游，也不收前端的數值）
+    env = resolve_feedback_env(
+        env_snapshot,
+        data.get("envAqiSite", ""),
+        data.get("locationName", ""),
+    )
+
     doc = {
         "userId": oid,
 
@@ -232,14 +421,11 @@ def submit_feedback():
         # Model rating
         "recommendationRating": int(data.get("recommendationRating", 0)),
 
-        # ===== 這裡是你要加的：環境資訊 =====
-        "envAqi": data.get("envAqi"),                         # number 或 null
-        "envAqiSite": data.get("envAqiSite", ""),             # 站名
-
-        # 今天預報的高低溫 & 溫差（來自 F-C0032-001）
-        "envMaxTemp": data.get("envMaxTemp"),
-        "envMinTemp": data.get("envMinTemp"),
-        "envTempDiff": data.get("envTempDiff"),
+        # ===== 環境資訊 =====
+        # envAqi / envAqiSite（縣市 站名）
+        # envMaxTemp / envMinTemp / envTempDiff / envPop12h（今天預報，來自 F-C0032-001）
+        # envSource: server / partial（快照缺欄位，等 env_backfill）/ backfill；舊資料可能是 client
+        **env,
 
         "feedbackDate": data.get("feedbackDate", ""),
         "createdAt": datetime.utcnow(),
@@ -247,6 +433,11 @@ def submit_feedback():
 
     feedback_col.insert_one(doc)
 
+    # 增量更新使用者的體感模型（缺溫度 / 穿搭 / 體感就跳過）
+    model_update = model_inc_update(doc)
+    if model_update:
+        users_col.update_one({"_id": oid}, model_update)
+
     return jsonify({"message": "feedback saved"})
 def get_today_str_taipei() -> str:
     """回傳台灣時區的今天日期字串，如 2025-12-11"""
@@ -274,89 +465,62 @@ def get_today_temp_range():
     # 前端傳來的縣市名稱，預設臺北市
     location_name = request.args.get("locationName", "臺北市")
 
-    params = {
-        "Authorization": api_key,
-        "format": "JSON",
-        "locationName": location_name,
-    }
+    if not env_snapshot.has_forecasts():
+        env_snapshot.refresh_forecast()
+        if not env_snapshot.has_forecasts():
+            return jsonify({
+                "success": False,
+                "error": "CWA F-C0032-001 request failed"
+            }), 502
 
-    try:
-        resp = requests.get(
-            "https://opendata.cwa.gov.tw/api/v1/rest/datastore/F-C0032-001",
-            params=params,
-            timeout=10,
-        )
-        resp.raise_for_status()
-    except requests.RequestException as e:
-        return jsonify({
-            "success": False,
-            "error": f"CWA F-C0032-001 request failed: {e}"
-        }), 502
-
-    data = resp.json()
-    locs = data.get("records", {}).get("location", [])
-    if not locs:
+    weather_elements = env_snapshot.get_forecast(location_name)
+    if not weather_elements:
         return jsonify({
             "success": False,
             "error": "No location data in CWA response"
         }), 404
 
-    loc = locs[0]
-    weather_elements = loc.get("weatherElement", [])
-
-    # 依 elementName 找該項
-    def pick_element(name: str):
-        for el in weather_elements:
-            if el.get("elementName") == name:
-                return el
-        return None
+    return jsonify({
+        "success": True,
+        "locationName": normalize_county(location_name),
+        **today_forecast(weather_elements),
+    })
 
-    # 以台灣時區判斷「今天」
-    tz = timezone(timedelta(hours=8))
-    today_str = datetime.now(tz).strftime("%Y-%m-%d")
 
-    # 從某個 weatherElement 裡挑出「今天」的 parameterName
-    def pick_today_param(el):
-        if not el:
-            return None
-        for t in el.get("time", []):
-            start = t.get("startTime", "")
-            if start.startswith(today_str):
-                p = t.get("parameter", {})
-                return p.get("parameterName")
-        # 找不到今天就用第一筆當 fallback
-        times = el.get("time", [])
-        if times:
-            return times[0].get("parameter", {}).get("parameterName")
-        return None
-
-    maxT_str = pick_today_param(pick_element("MaxT"))
-    minT_str = pick_today_param(pick_element("MinT"))
-    pop12h_str = pick_today_param(pick_element("PoP12h"))
-    wx_str = pick_today_param(pick_element("Wx"))
-
-    def to_int_or_none(s):
-        try:
-            return int(s)
-        except (TypeError, ValueError):
-            return None
+@app.get("/api/weather/history")
+def get_weather_history():
+    """
+    單一縣市的預報 MaxT / MinT / PoP12h 歷史
+    ?locationName=臺北市&from=2025-11-01&to=2025-12-01&step=1d
+    """
+    # 歷史資料以正規化的縣市名（臺）存，「台北市」也要查得到
+    location_name = normalize_county(request.args.get("locationName", "臺北市"))
+    return _history_response("forecast", location_name)
 
-    max_temp = to_int_or_none(maxT_str)
-    min_temp = to_int_or_none(minT_str)
-    pop12h = to_int_or_none(pop12h_str)
 
-    temp_diff = None
-    if max_temp is not None and min_temp is not None:
-        temp_diff = max_temp - min_temp
+@app.get("/api/weather/hourly")
+def get_township_hourly():
+    """
+    鄉鎮逐時溫度 / 體感溫度 / 降雨機率（F-D0047-089）
+    ?city=新北市&district=烏來區&hours=48（從現在這個小時開始，最多 72 小時）
+    """
+    city = request.args.get("city", "").strip()
+    district = request.args.get("district", "").strip()
+    if not city or not district:
+        return jsonify({"success": False, "error": "Missing city or district"}), 400
+    try:
+        hours = min(max(int(request.args.get("hours", "48")), 1), 72)
+    except ValueError:
+        return jsonify({"success": False, "error": "Invalid hours"}), 400
 
+    points = query_hourly(township_forecast_col, city, district, hours=hours)
+    if points is None:
+        return jsonify({"success": False, "error": f"Unknown town: {city} {district}"}), 404
     return jsonify({
         "success": True,
-        "locationName": loc.get("locationName", location_name),
-        "maxTemp": max_temp,
-        "minTemp": min_temp,
-        "tempDiff": temp_diff,
-        "pop12h": pop12h,        
-        "weatherDesc": wx_str,     # 天氣敘述文字
+        "city": normalize_county(city),
+        "district": district,
+        "points": points,
     })
 
 
@@ -377,6 +541,76 @@ def get_all_feedback():
 
     return jsonify({"success": True, "data": feedbacks})
 
+# ========== Analytics ==========
+
+@app.get("/api/analytics/allergy")
+@jwt_required()
+def get_allergy_analytics():
+    """
+    全體使用者 allergyImpact / 症狀 與 AQI 等級、溫差的統計（讀 summary collection）
+    ?groupBy=aqiBand|swingBand|site|week&site=臺北市 中山&from=2025-10-01&to=2025-12-31
+    """
+    group_by = request.args.get("groupBy", "aqiBand")
+    if group_by not in GROUP_FIELDS:
+        return jsonify({
+            "success": False,
+            "error": f"Invalid groupBy, use one of {', '.join(GROUP_FIELDS)}"
+        }), 400
+
+    def parse_date(s):
+        try:
+            return datetime.strptime(s, "%Y-%m-%d") if s else None
+        except ValueError:
+            return None
+
+    since = parse_date(request.args.get("from"))
+    until = parse_date(request.args.get("to"))
+    if (request.args.get("from") and not since) or (request.args.get("to") and not until):
+        return jsonify({"success": False, "error": "Invalid from/to (use YYYY-MM-DD)"}), 400
+
+    result = query_allergy_analytics(
+        allergy_analytics_col,
+        group_by,
+        site=request.args.get("site") or None,
+        since=since,
+        until=until,
+    )
+    return jsonify({"success": True, "groupBy": group_by, **result})
+
+# ========== Gemini key pool ==========
+# 有設 GEMINI_API_KEYS 就用伺服器的 key，使用者的 geminiApiKey 變成選填
+gemini_pool = GeminiKeyPool.from_env()
+
+
+def generate_lines(user_key, prompt, expected_lines):
+    """優先走 key pool；pool 滿了且使用者有帶 key 才改用使用者的 key"""
+    if gemini_pool is not None:
+        try:
+            return gemini_pool.generate(prompt, expected_lines=expected_lines)
+        except PoolSaturated:
+            if not user_key:
+                raise
+    return call_gemini(user_key, prompt, expected_lines=expected_lines)
+
+
+def gemini_busy_response(retry_after):
+    """Gemini 額度用完又沒有可用的 cache 時回 503（不把 429 直接丟給前端）"""
+    resp = jsonify({
+        "success": False,
+        "error": "AI service is busy, please retry later",
+        "retryAfter": int(math.ceil(retry_after)),
+    })
+    resp.headers["Retry-After"] = str(int(math.ceil(retry_after)))
+    return resp, 503
+
+
+def _http_retry_after(resp, default=30.0):
+    try:
+        return float(resp.headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
 # ========== AI Allergy Tips ==========
 
 @app.route("/api/ai/allergy-tips", methods=["POST", "OPTIONS"])
@@ -392,7 +626,7 @@ def get_allergy_tips():
     body = request.get_json() or {}
 
     api_key = body.get("geminiApiKey") or body.get("apiKey")
-    if not api_key:
+    if not api_key and gemini_pool is None:
         return jsonify({
             "success": False,
             "error": "Missing Gemini API key"
@@ -444,8 +678,20 @@ def get_allergy_tips():
 
     prompt = build_allergy_prompt(feedbacks, today_env)
 
+    def rate_limited(retry_after):
+        # 額度用完：有舊的 tips 就先回舊的
+        tips = ((cache_doc or {}).get("result") or {}).get("tips")
+        if tips:
+            return jsonify({
+                "success": True,
+                "tips": tips,
+                "fromCache": True,
+                "rateLimited": True,
+            })
+        return gemini_busy_response(retry_after)
+
     try:
-        tips = call_gemini(api_key, prompt, expected_lines=5)
+        tips = generate_lines(api_key, prompt, 5)
 
         # 更新 / 建立 cache
         ai_suggestions_col.update_one(
@@ -463,11 +709,15 @@ def get_allergy_tips():
 
         return jsonify({"success": True, "tips": tips})
 
+    except PoolSaturated as e:
+        return rate_limited(e.retry_after)
     except HTTPError as e:
         resp = e.response
         status = resp.status_code if resp is not None else 500
         body_text = resp.text if resp is not None else ""
         print("Gemini HTTP error:", status, body_text[:800])
+        if status == 429:
+            return rate_limited(_http_retry_after(resp))
         return jsonify({
             "success": False,
             "error": f"Gemini HTTP error {status}",
@@ -495,11 +745,6 @@ def get_outfit_suggestion():
 
     body = request.get_json() or {}
     api_key = body.get("geminiApiKey")
-    if not api_key:
-        return jsonify({
-            "success": False,
-            "error": "Missing Gemini API key"
-        }), 400
 
     env = body.get("env") or {}
 
@@ -549,15 +794,49 @@ def get_outfit_suggestion():
             "refreshLimitReached": True,
         })
 
+    # 以下只有要產生新建議時才需要（cache 命中不查鄉鎮預報 / 體感模型）
+    # 有帶鄉鎮就用鄉鎮逐時預報的白天高低溫 / 降雨機率取代縣市層級的數值；
+    # 鄉鎮要跟前端預報用的縣市（county）一致，不然維持縣市層級的數值
+    if (
+        env.get("city") and env.get("district") and env.get("county")
+        and normalize_county(env["city"]) == normalize_county(env["county"])
+    ):
+        today_start = datetime.now(TAIPEI_TZ).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+        points = query_hourly(township_forecast_col, env["city"], env["district"], start=today_start, hours=24)
+        if points:
+            township = summarize_hours(points)
+            today_env.update({k: v for k, v in township.items() if v is not None})
+
+    # 使用者體感模型的候選穿搭排名（給 prompt 參考，LLM 不可用時直接回傳）
+    user = users_col.find_one({"_id": oid}, {"comfortModel": 1}) or {}
+    comfort_model = user.get("comfortModel")
+    ranked = rank_outfits(comfort_model, today_env)
+
+    def model_fallback():
+        n_samples = (comfort_model or {}).get("n", 0)
+        return jsonify({
+            "success": True,
+            **outfit_from_ranking(ranked, n_samples),
+            "fromModel": True,
+        })
+
+    if not api_key and gemini_pool is None:
+        if ranked:
+            return model_fallback()
+        return jsonify({
+            "success": False,
+            "error": "Missing Gemini API key"
+        }), 400
+
     # 3) 先抓最近 10 筆 feedback
     cursor = feedback_col.find({"userId": oid}).sort("createdAt", -1).limit(10)
     feedbacks = list(cursor)
 
-    prompt = build_outfit_prompt(feedbacks, today_env)
+    prompt = build_outfit_prompt(feedbacks, today_env, ranked)
 
     try:
         # 穿搭：預期 4 行
-        lines = call_gemini(api_key, prompt, expected_lines=4)
+        lines = generate_lines(api_key, prompt, 4)
 
         result = {
             "top":    lines[0] if len(lines) > 0 else "",
@@ -585,16 +864,33 @@ def get_outfit_suggestion():
             **result,
         })
 
+    except PoolSaturated as e:
+        if ranked:
+            return model_fallback()
+        return gemini_busy_response(e.retry_after)
     except HTTPError as e:
         resp = e.response
         status = resp.status_code if resp is not None else 500
         body_text = resp.text if resp is not None else ""
         print("Gemini outfit HTTP error:", status, body_text[:800])
+        # 只有 Gemini 暫時不能用（429 / 5xx）才改用體感模型；400 / 403（例如 key 無效）照常回錯誤
+        if ranked and (status == 429 or status >= 500):
+            return model_fallback()
+        if status == 429:
+            return gemini_busy_response(_http_retry_after(resp))
         return jsonify({
             "success": False,
             "error": f"Gemini HTTP error {status}",
             "detail": body_text,
         }), status
+    except (Timeout, RequestsConnectionError) as e:
+        print("Gemini outfit unavailable:", repr(e))
+        if ranked:
+            return model_fallback()
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
     except Exception as e:
         print("Gemini outfit error (other):", repr(e))
         return jsonify({
@@ -615,5 +911,12 @@ def health_check():
 def api_health():
     return jsonify({"status": "ok"})
 
+
+@app.route("/api/ready", methods=["GET"])
+def api_ready():
+    """readiness：MongoDB 連線與 index 建立完成才回 200"""
+    state = readiness()
+    return jsonify(state), 200 if state["status"] == "ready" else 503
+
 if __name__ == "__main__":
     app.run(port=5000, debug=True)
\ No newline at end of file
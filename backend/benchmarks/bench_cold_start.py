@@ -0,0 +1,88 @@
+# benchmarks/bench_cold_start.py
+"""
+量測冷啟動：新 process 從 import app 到 /health 第一個回應的時間。
+
+每一輪開一個新的 Python process（跟 gunicorn worker 開機一樣從零 import），
+用 Flask test client 打 /health。預設 MONGO_URI 指向不會回應的位址，
+確認開機路徑完全不等 MongoDB。
+
+用法（在 backend/ 底下）：
+    python benchmarks/bench_cold_start.py --runs 10
+    MONGO_URI=mongodb+srv://... python benchmarks/bench_cold_start.py --ready
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+import app
+t_import = time.perf_counter()
+client = app.app.test_client()
+resp = client.get("/health")
+t_health = time.perf_counter()
+result = {
+    "import_ms": (t_import - t0) * 1000,
+    "first_response_ms": (t_health - t0) * 1000,
+    "status": resp.status_code,
+}
+if WAIT_READY:
+    while client.get("/api/ready").status_code != 200:
+        if time.perf_counter() - t0 > 60:
+            break
+        time.sleep(0.05)
+    result["ready_ms"] = (time.perf_counter() - t0) * 1000
+print(json.dumps(result))
+"""
+
+
+def run_once(wait_ready: bool) -> dict:
+    env = dict(os.environ)
+    # 不可路由的位址：如果開機路徑有連 Mongo，這裡會卡到 timeout
+    env.setdefault("MONGO_URI", "mongodb://10.255.255.1:27017/?serverSelectionTimeoutMS=5000")
+    env.setdefault("ANALYTICS_REFRESH_SEC", "0")
+    code = f"WAIT_READY = {wait_ready!r}\n" + CHILD
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr[-2000:])
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def summarize(values):
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))]
+    return {
+        "median": round(statistics.median(values), 1),
+        "p95": round(p95, 1),
+        "max": round(values[-1], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--ready", action="store_true", help="同時量到 /api/ready 回 200 的時間（需要真的 MongoDB）")
+    args = parser.parse_args()
+
+    results = [run_once(args.ready) for _ in range(args.runs)]
+    report = {
+        "runs": args.runs,
+        "import_ms": summarize([r["import_ms"] for r in results]),
+        "first_response_ms": summarize([r["first_response_ms"] for r in results]),
+    }
+    if args.ready:
+        report["ready_ms"] = summarize([r["ready_ms"] for r in results])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
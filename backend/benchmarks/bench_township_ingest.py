@@ -0,0 +1,201 @@
+# benchmarks/bench_township_ingest.py
+"""
+量測鄉鎮逐時預報（F-D0047-089 全國資料）的更新成本。
+
+預設用合成的全國資料（22 縣市、368 鄉鎮、72 小時溫度 / 體感溫度 + 3 小時降雨機率），
+也可以用 --payload 指定實際下載的 JSON。分別量：
+    parse       JSON → 各鄉鎮時段（含 tracemalloc 記憶體高峰）
+    first       空資料庫時的 diff（全部都是新增）
+    incremental 模擬下一次發布：時間往後 3 小時、約 5% 數值改變
+加上 --mongo 會真的寫進 MONGO_URI 的暫存 collection，並量 query_hourly 延遲，最後刪掉。
+
+用法（在 backend/ 底下）：
+    python benchmarks/bench_township_ingest.py --runs 5
+    MONGO_URI=mongodb+srv://... python benchmarks/bench_township_ingest.py --mongo
+    python benchmarks/bench_township_ingest.py --payload F-D0047-089.json
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from township_forecast import (  # noqa: E402
+    parse_township_payload, plan_updates, ensure_township_indexes, load_state, query_hourly,
+)
+
+N_COUNTIES = 22
+N_TOWNS = 368
+HOURS = 72
+
+
+def synthetic_payload(start: datetime, seed: int = 0, change_rate: float = 0.0) -> dict:
+    """
+    跟 F-D0047-089 相同結構的全國資料。數值只由（鄉鎮, 時間）決定，
+    所以 start 往後移時重疊的時段數值相同；change_rate 比例的數值會再 +1。
+    """
+    rng = random.Random(seed)
+    noise = random.Random(seed + 1)
+
+    def value(town_id, base, ts, spread, kind):
+        r = random.Random(f"{seed}-{town_id}-{kind}-{ts:%Y%m%d%H}")
+        v = round(base + spread * (ts.hour - 12) / 12 + r.uniform(-1, 1))
+        if noise.random() < change_rate:
+            v += 1
+        return str(v)
+
+    def iso(ts):
+        return ts.strftime("%Y-%m-%dT%H:%M:%S+08:00")
+
+    counties = []
+    per_county = N_TOWNS // N_COUNTIES + 1
+    town_id = 0
+    for c in range(N_COUNTIES):
+        locations = []
+        for _ in range(per_county):
+            if town_id >= N_TOWNS:
+                break
+            base = rng.uniform(12, 28)
+            lat, lon = 22 + rng.random() * 3, 120 + rng.random() * 2
+
+            temps, feels, pops = [], [], []
+            for h in range(HOURS):
+                ts = start + timedelta(hours=h)
+                temps.append({"DataTime": iso(ts), "ElementValue": [{"Temperature": value(town_id, base, ts, 4, "t")}]})
+                feels.append({"DataTime": iso(ts), "ElementValue": [{"ApparentTemperature": value(town_id, base, ts, 5, "at")}]})
+            for h in range(0, HOURS, 3):
+                ts = start + timedelta(hours=h)
+                pop = random.Random(f"{seed}-{town_id}-pop-{ts:%Y%m%d%H}").choice(range(0, 101, 10))
+                pops.append({
+                    "StartTime": iso(ts),
+                    "EndTime": iso(ts + timedelta(hours=3)),
+                    "ElementValue": [{"ProbabilityOfPrecipitation": str(pop)}],
+                })
+            locations.append({
+                "LocationName": f"鄉鎮{town_id:03d}",
+                "Geocode": f"{10000000 + town_id}",
+                "Latitude": f"{lat:.3f}",
+                "Longitude": f"{lon:.3f}",
+                "WeatherElement": [
+                    {"ElementName": "溫度", "Time": temps},
+                    {"ElementName": "體感溫度", "Time": feels},
+                    {"ElementName": "3小時降雨機率", "Time": pops},
+                ],
+            })
+            town_id += 1
+        counties.append({"LocationsName": f"縣市{c:02d}", "Location": locations})
+    return {"records": {"Locations": counties}}
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def summarize(values):
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))]
+    return {"median": round(statistics.median(values), 2), "p95": round(p95, 2), "max": round(values[-1], 2)}
+
+
+def state_from(towns):
+    return {key: copy.deepcopy(town["slots"]) for key, town in towns.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--payload", help="實際的 F-D0047-089 JSON 檔（預設用合成資料）")
+    parser.add_argument("--mongo", action="store_true", help="寫入 MONGO_URI 的暫存 collection 並量查詢延遲")
+    args = parser.parse_args()
+
+    start = datetime.now().replace(minute=0, second=0, microsecond=0)
+    if args.payload:
+        with open(args.payload, encoding="utf-8") as f:
+            payload = json.load(f)
+        # 真實資料沒有「下一版」，用同一份再把 5% 數值 +1 模擬
+        next_payload = copy.deepcopy(payload)
+        noise = random.Random(1)
+        for county in next_payload["records"]["Locations"]:
+            for loc in county["Location"]:
+                for el in loc["WeatherElement"]:
+                    for t in el["Time"]:
+                        for ev in t["ElementValue"]:
+                            for k, v in ev.items():
+                                if noise.random() < 0.05 and v.lstrip("-").isdigit():
+                                    ev[k] = str(int(v) + 1)
+    else:
+        payload = synthetic_payload(start)
+        # 下一次發布：往後 3 小時（最早的 3 小時過期、最後多 3 小時）
+        next_payload = synthetic_payload(start + timedelta(hours=3), change_rate=0.05)
+
+    payload_bytes = len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+    # 記憶體另外量一次（tracemalloc 會讓 parse 慢好幾倍）
+    tracemalloc.start()
+    towns = parse_township_payload(payload)
+    parse_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    parse_ms, first_ms, incr_ms = [], [], []
+    for _ in range(args.runs):
+        towns, ms = timed(lambda: parse_township_payload(payload))
+        parse_ms.append(ms)
+
+        (first_ops, first_stats), ms = timed(lambda: plan_updates(towns, {}, now=start))
+        first_ms.append(ms)
+
+        state = state_from(towns)
+        next_towns = parse_township_payload(next_payload)
+        (incr_ops, incr_stats), ms = timed(
+            lambda: plan_updates(next_towns, state, now=start + timedelta(hours=3))
+        )
+        incr_ms.append(ms)
+
+    slots = sum(len(t["slots"]) for t in towns.values())
+    report = {
+        "runs": args.runs,
+        "payloadMB": round(payload_bytes / 1e6, 2),
+        "towns": len(towns),
+        "slots": slots,
+        "parse_ms": summarize(parse_ms),
+        "parsePeakMB": round(parse_peak / 1e6, 2),
+        "first": {"plan_ms": summarize(first_ms), "ops": len(first_ops), **first_stats},
+        "incremental": {"plan_ms": summarize(incr_ms), "ops": len(incr_ops), **incr_stats},
+    }
+
+    if args.mongo:
+        from pymongo import MongoClient
+
+        col = MongoClient(os.environ["MONGO_URI"])["BreezyDay"][f"township_forecast_bench_{os.getpid()}"]
+        try:
+            ensure_township_indexes(col)
+            _, ms = timed(lambda: col.bulk_write(first_ops, ordered=False))
+            report["first"]["write_ms"] = round(ms, 1)
+
+            # 用資料庫裡的現值重新 diff（跟正式流程一樣）
+            db_state, load_ms = timed(lambda: load_state(col))
+            ops, _ = plan_updates(next_towns, db_state, now=start + timedelta(hours=3))
+            _, ms = timed(lambda: col.bulk_write(ops, ordered=False) if ops else None)
+            report["incremental"]["loadState_ms"] = round(load_ms, 1)
+            report["incremental"]["write_ms"] = round(ms, 1)
+
+            keys = random.Random(2).sample(list(towns), min(200, len(towns)))
+            query_ms = [timed(lambda: query_hourly(col, c, d, start=start, hours=48))[1] for c, d in keys]
+            report["query_ms"] = summarize(query_ms)
+        finally:
+            col.drop()
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+# comfort_model.py
+"""
+每個使用者一個小型「體感」線性模型：
+    feel ≈ w · [1, minT, maxT, tempDiff, rainPop, warmth]
+feel：very_cold = -1、just_right = 0、very_hot = +1
+
+只存充分統計量 XᵀX（6x6）與 Xᵀy（6），每筆 feedback 用 $inc 原子累加，
+評分時加上 prior 解一次 6x6 ridge regression，再用 NumPy 一次算完所有候選穿搭。
+"""
+from typing import Dict, List, Optional
+import itertools
+import math
+import numpy as np
+
+N_FEATURES = 6
+
+FEEL_SCORES = {
+    "very_cold": -1.0,
+    "cold": -0.5,
+    "just_right": 0.0,
+    "hot": 0.5,
+    "very_hot": 1.0,
+}
+
+# ===== 保暖程度（對應 FeedbackPage 的選項）=====
+# feedback 的 outfitTop 可能直接是外套，所以外套的值包含裡面那件
+TOP_WARMTH = {
+    "tshirt_short": 1.0,
+    "tshirt_long": 1.5,
+    "shirt": 1.5,
+    "sweater": 2.5,
+    "hoodie": 2.5,
+    "jacket_light": 3.0,
+    "coat_thick": 5.0,
+}
+OUTER_WARMTH = {
+    "none": 0.0,
+    "jacket_light": 2.0,
+    "coat_thick": 4.0,
+}
+BOTTOM_WARMTH = {
+    "shorts": 0.0,
+    "skirt": 0.3,
+    "leggings": 1.0,
+    "jeans": 1.5,
+    "long_pants": 1.5,
+}
+SHOES_WARMTH = {
+    "sandals": 0.0,
+    "slippers": 0.0,
+    "sneakers": 0.5,
+    "leather": 0.5,
+    "boots": 1.0,
+}
+ACCESSORY_WARMTH = {
+    "scarf": 0.5,
+    "hat": 0.2,
+}
+
+LABELS = {
+    "tshirt_short": "Short-sleeve T-shirt",
+    "tshirt_long": "Long-sleeve T-shirt",
+    "shirt": "Shirt / blouse",
+    "sweater": "Sweater",
+    "hoodie": "Hoodie",
+    "jacket_light": "Light jacket",
+    "coat_thick": "Thick coat",
+    "none": "No outerwear needed",
+    "shorts": "Shorts",
+    "skirt": "Skirt",
+    "leggings": "Leggings",
+    "jeans": "Jeans",
+    "long_pants": "Long pants",
+}
+
+# ===== Prior =====
+# 特徵縮放後（溫度 /10、降雨 /100、保暖 /5），一般人約在均溫 22°C、
+# T-shirt + 牛仔褲 + 球鞋（warmth 3）時覺得剛好；
+# 溫度每升 10°C 約 +0.8，保暖每多 5 級約 +1
+PRIOR_WEIGHTS = np.array([-2.28, 0.4, 0.4, -0.1, -0.1, 1.0])
+PRIOR_STRENGTH = 3.0
+
+# 每件的「厚薄等級」：0 = 夏天、1 = 春秋、2 = 冬天（不穿外套不算）
+LAYER_TIER = {
+    "tshirt_short": 0,
+    "tshirt_long": 1,
+    "shirt": 1,
+    "sweater": 2,
+    "hoodie": 2,
+    "jacket_light": 1,
+    "coat_thick": 2,
+    "shorts": 0,
+    "skirt": 0,
+    "leggings": 1,
+    "jeans": 1,
+    "long_pants": 1,
+}
+
+
+def _tier_gap(top: str, outer: str, bottom: str) -> int:
+    tiers = [LAYER_TIER[top], LAYER_TIER[bottom]]
+    if outer != "none":
+        tiers.append(LAYER_TIER[outer])
+    return max(tiers) - min(tiers)
+
+
+# 候選穿搭：上衣 × 外套 × 下身（鞋子固定 sneakers）
+# 只看 warmth 總和的話「短袖 + 厚外套 + 裙子」會跟正常搭配同分，
+# 所以厚薄差兩級以上的組合不列入候選
+_CANDIDATES = [
+    {"top": top, "outer": outer, "bottom": bottom}
+    for top, outer, bottom in itertools.product(
+        ["tshirt_short", "tshirt_long", "shirt", "sweater", "hoodie"],
+        list(OUTER_WARMTH),
+        list(BOTTOM_WARMTH),
+    )
+    if _tier_gap(top, outer, bottom) <= 1
+]
+_CANDIDATE_GAP = np.array([_tier_gap(c["top"], c["outer"], c["bottom"]) for c in _CANDIDATES])
+_CANDIDATE_WARMTH = np.array([
+    TOP_WARMTH[c["top"]] + OUTER_WARMTH[c["outer"]] + BOTTOM_WARMTH[c["bottom"]] + SHOES_WARMTH["sneakers"]
+    for c in _CANDIDATES
+])
+
+
+def outfit_warmth(fb: Dict) -> Optional[float]:
+    """feedback 穿搭的保暖程度；上衣或下身不認得就回傳 None"""
+    top = TOP_WARMTH.get(fb.get("outfitTop"))
+    bottom = BOTTOM_WARMTH.get(fb.get("outfitBottom"))
+    if top is None or bottom is None:
+        return None
+    return (
+        top
+        + bottom
+        + SHOES_WARMTH.get(fb.get("outfitShoes"), 0.5)
+        + ACCESSORY_WARMTH.get(fb.get("outfitAccessories"), 0.0)
+    )
+
+
+def _num(v) -> Optional[float]:
+    """數字或數字字串 → float；None / 非數字 / NaN 都當作缺值"""
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return f if math.isfinite(f) else None
+
+
+def _env_features(t_min, t_max, rain_pop) -> Optional[np.ndarray]:
+    t_min, t_max = _num(t_min), _num(t_max)
+    if t_min is None or t_max is None:
+        return None
+    rain = _num(rain_pop)
+    rain = 0.0 if rain is None else rain
+    return np.array([1.0, t_min / 10, t_max / 10, (t_max - t_min) / 10, rain / 100])
+
+
+def feedback_features(fb: Dict):
+    """feedback → (x, y)；缺資料時回傳 None"""
+    y = FEEL_SCORES.get(fb.get("temperatureFeel"))
+    warmth = outfit_warmth(fb)
+    env = _env_features(fb.get("envMinTemp"), fb.get("envMaxTemp"), fb.get("envPop12h"))
+    if y is None or warmth is None or env is None:
+        return None
+    return np.append(env, warmth / 5), y
+
+
+def model_inc_update(fb: Dict) -> Optional[Dict]:
+    """
+    給 users_col.update_one 用的 $inc 內容（comfortModel.xtx.i / xty.i / n）。
+    $inc 是原子操作，同時多筆 feedback 寫入也不會互相覆蓋。
+    """
+    pair = feedback_features(fb)
+    if pair is None:
+        return None
+    x, y = pair
+    inc = {"comfortModel.n": 1}
+    for i, v in enumerate(np.outer(x, x).ravel()):
+        inc[f"comfortModel.xtx.{i}"] = float(v)
+    for i, v in enumerate(x * y):
+        inc[f"comfortModel.xty.{i}"] = float(v)
+    return {"$inc": inc}
+
+
+def _as_vector(v, size: int) -> np.ndarray:
+    # 第一次 $inc 到不存在的 xtx.0 時 Mongo 會建成 {"0": ...} 物件而不是陣列
+    if isinstance(v, dict):
+        return np.array([float(v.get(str(i), 0.0)) for i in range(size)])
+    return np.asarray(v, dtype=float)
+
+
+def _weights(model: Optional[Dict]) -> np.ndarray:
+    """ridge regression 往 prior 收縮：(λI + XᵀX) w = λ w0 + Xᵀy"""
+    a = PRIOR_STRENGTH * np.eye(N_FEATURES)
+    b = PRIOR_STRENGTH * PRIOR_WEIGHTS
+    if model and model.get("n"):
+        a = a + _as_vector(model["xtx"], N_FEATURES * N_FEATURES).reshape(N_FEATURES, N_FEATURES)
+        b = b + _as_vector(model["xty"], N_FEATURES)
+    return np.linalg.solve(a, b)
+
+
+def rank_outfits(model: Optional[Dict], today_env: Dict, top_k: int = 3) -> List[Dict]:
+    """
+    用使用者模型替所有候選穿搭打分（預測體感越接近 0 越好，同分時厚薄一致的優先），回傳前 top_k 名：
+    [{"top": ..., "outer": ..., "bottom": ..., "predictedFeel": -0.12}, ...]
+    缺今日溫度時回傳 []。
+    """
+    env = _env_features(today_env.get("tempMin"), today_env.get("tempMax"), today_env.get("rainPop"))
+    if env is None:
+        return []
+
+    w = _weights(model)
+    # 環境部分對每個候選都一樣，只有 warmth 不同
+    pred = env @ w[:5] + (_CANDIDATE_WARMTH / 5) * w[5]
+    # 預測體感差不到 0.05 視為同分，同分時厚薄比較一致的優先
+    order = np.lexsort((_CANDIDATE_GAP, np.round(np.abs(pred) / 0.05)))[:top_k]
+
+    return [
+        {**_CANDIDATES[i], "predictedFeel": round(float(pred[i]), 2)}
+        for i in order
+    ]
+
+
+def outfit_from_ranking(ranked: List[Dict], n_samples: int) -> Dict:
+    """LLM 不可用時，直接把第一名轉成 /api/ai/outfit 的回傳格式"""
+    best = ranked[0]
+    return {
+        "top": LABELS[best["top"]],
+        "outer": LABELS[best["outer"]],
+        "bottom": LABELS[best["bottom"]],
+        "note": (
+            f"Predicted comfort {best['predictedFeel']:+.1f} (0 = just right), "
+            f"based on {n_samples} of your feedback records."
+        ),
+    }
@@ -0,0 +1,155 @@
+# env_backfill.py
+"""
+批次補齊舊 feedback 的環境欄位（envAqi / envMaxTemp / envMinTemp / envTempDiff / envPop12h）。
+資料來源是 env_history 的每日 bucket，不打上游 API。
+
+用法：
+    python env_backfill.py            # 只處理 envSource 不是 server / backfill 的紀錄
+    python env_backfill.py --all      # 全部重算
+"""
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import os
+import sys
+from pymongo import MongoClient, UpdateOne
+from dotenv import load_dotenv
+
+TAIPEI_TZ = timezone(timedelta(hours=8))
+BATCH_SIZE = 500
+
+
+def _local_time(doc: Dict) -> Optional[datetime]:
+    """feedback 的台灣當地時間：優先 createdAt（UTC），其次 feedbackDate"""
+    created = doc.get("createdAt")
+    if isinstance(created, datetime):
+        return created.replace(tzinfo=timezone.utc).astimezone(TAIPEI_TZ).replace(tzinfo=None)
+    date_str = (doc.get("feedbackDate") or "")[:10]
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d") + timedelta(hours=12)
+    except ValueError:
+        return None
+
+
+def _split_site(env_site: str) -> Tuple[str, str]:
+    """「臺北市 中山」→ ("臺北市", "中山")"""
+    parts = (env_site or "").strip().split(" ")
+    if len(parts) >= 2:
+        return parts[0].replace("台", "臺"), parts[-1]
+    return "", parts[0] if parts else ""
+
+
+def _aqi_at(bucket: Optional[Dict], hour: int) -> Optional[int]:
+    """取最接近 hour 的逐時 AQI；已壓縮的 bucket 用當天平均"""
+    if not bucket:
+        return None
+    hours = bucket.get("hours") or {}
+    candidates = [
+        (abs(int(hh) - hour), v.get("aqi"))
+        for hh, v in hours.items()
+        if v and v.get("aqi") is not None
+    ]
+    if candidates:
+        return int(round(min(candidates)[1]))
+    s = (bucket.get("summary") or {}).get("aqi")
+    if s and s.get("count"):
+        return int(round(s["sum"] / s["count"]))
+    return None
+
+
+def _forecast_of_day(bucket: Optional[Dict]) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """一天內各預報時段的最高 MaxT、最低 MinT、最高 PoP12h"""
+    if not bucket:
+        return None, None, None
+    hours = [v for v in (bucket.get("hours") or {}).values() if v]
+    summary = bucket.get("summary") or {}
+
+    def pick(field: str, agg, stat: str):
+        vals = [v.get(field) for v in hours if v.get(field) is not None]
+        if not vals and summary.get(field):
+            vals = [summary[field][stat]]
+        return int(round(agg(vals))) if vals else None
+
+    return pick("maxTemp", max, "max"), pick("minTemp", min, "min"), pick("pop12h", max, "max")
+
+
+def _load_buckets(history_col, kind: str, keys_days: set) -> Dict[Tuple[str, str], Dict]:
+    """一次把一批需要的 (key, day) bucket 撈回來"""
+    if not keys_days:
+        return {}
+    keys = list({k for k, _ in keys_days})
+    days = list({d for _, d in keys_days})
+    cursor = history_col.find(
+        {"kind": kind, "key": {"$in": keys}, "day": {"$in": days}},
+        {"key": 1, "day": 1, "hours": 1, "summary": 1},
+    )
+    return {(b["key"], b["day"]): b for b in cursor}
+
+
+def _enrich_batch(feedback_col, history_col, docs: List[Dict]) -> Tuple[int, int]:
+    plans = []
+    aqi_needed, fc_needed = set(), set()
+    for doc in docs:
+        ts = _local_time(doc)
+        county, site = _split_site(doc.get("envAqiSite", ""))
+        if ts is None or not site:
+            continue
+        day = ts.strftime("%Y-%m-%d")
+        plans.append((doc["_id"], ts, county, site, day))
+        aqi_needed.add((site, day))
+        if county:
+            fc_needed.add((county, day))
+
+    aqi_buckets = _load_buckets(history_col, "aqi", aqi_needed)
+    fc_buckets = _load_buckets(history_col, "forecast", fc_needed)
+
+    ops = []
+    for _id, ts, county, site, day in plans:
+        aqi = _aqi_at(aqi_buckets.get((site, day)), ts.hour)
+        max_t, min_t, pop = _forecast_of_day(fc_buckets.get((county, day)))
+        if aqi is None and max_t is None:
+            continue
+
+        update = {"envSource": "backfill"}
+        if aqi is not None:
+            update["envAqi"] = aqi
+        if max_t is not None and min_t is not None:
+            update["envMaxTemp"] = max_t
+            update["envMinTemp"] = min_t
+            update["envTempDiff"] = max_t - min_t
+        if pop is not None:
+            update["envPop12h"] = pop
+        ops.append(UpdateOne({"_id": _id}, {"$set": update}))
+
+    if ops:
+        feedback_col.bulk_write(ops, ordered=False)
+    return len(docs), len(ops)
+
+
+def backfill_feedback_env(feedback_col, history_col, all_records: bool = False) -> Dict[str, int]:
+    """批次補齊 feedback 的環境欄位，回傳 {"scanned": n, "updated": m}"""
+    query = {} if all_records else {"envSource": {"$nin": ["server", "backfill"]}}
+    cursor = feedback_col.find(
+        query,
+        {"envAqiSite": 1, "createdAt": 1, "feedbackDate": 1},
+    ).batch_size(BATCH_SIZE)
+
+    scanned = updated = 0
+    batch: List[Dict] = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= BATCH_SIZE:
+            n, m = _enrich_batch(feedback_col, history_col, batch)
+            scanned, updated = scanned + n, updated + m
+            batch = []
+    if batch:
+        n, m = _enrich_batch(feedback_col, history_col, batch)
+        scanned, updated = scanned + n, updated + m
+
+    return {"scanned": scanned, "updated": updated}
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_URI"))["BreezyDay"]
+    result = backfill_feedback_env(db["feedback"], db["env_history"], "--all" in sys.argv)
+    print(f"scanned={result['scanned']} updated={result['updated']}")
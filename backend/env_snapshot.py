@@ -0,0 +1,280 @@
+# env_snapshot.py
+from typing import Callable, Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+import json
+import threading
+import time
+import requests
+
+TAIPEI_TZ = timezone(timedelta(hours=8))
+
+CWA_FORECAST_URL = "https://opendata.cwa.gov.tw/api/v1/rest/datastore/F-C0032-001"
+
+# MOENV 每小時更新、CWA 每 6 小時更新，快取時間抓短一點
+AQI_TTL_SEC = 10 * 60
+FORECAST_TTL_SEC = 30 * 60
+# 上游失敗時，多久後再試（期間沿用舊資料）
+RETRY_AFTER_SEC = 60
+
+
+def normalize_county(name: str) -> str:
+    """CWA 用「臺」，使用者常打「台」"""
+    return (name or "").strip().replace("台", "臺")
+
+
+def fetch_aqi_payload(api_key: str, base_url: str) -> Dict:
+    resp = requests.get(f"{base_url}?api_key={api_key}&format=json", timeout=8)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def fetch_county_forecasts(api_key: str) -> Dict[str, List[Dict]]:
+    """一次抓 F-C0032-001 全部縣市，回傳 {縣市: weatherElement list}"""
+    resp = requests.get(
+        CWA_FORECAST_URL,
+        params={"Authorization": api_key, "format": "JSON"},
+        timeout=10,
+    )
+    resp.raise_for_status()
+    locs = resp.json().get("records", {}).get("location", [])
+    return {
+        loc.get("locationName", ""): loc.get("weatherElement", [])
+        for loc in locs
+        if loc.get("locationName")
+    }
+
+
+def today_forecast(weather_elements: List[Dict], today_str: Optional[str] = None) -> Dict:
+    """
+    從 F-C0032-001 的 weatherElement 挑出「今天」的：
+    maxTemp / minTemp / tempDiff / pop12h / weatherDesc
+    """
+    if today_str is None:
+        today_str = datetime.now(TAIPEI_TZ).strftime("%Y-%m-%d")
+
+    # 依 elementName 找該項
+    def pick_element(name: str):
+        for el in weather_elements:
+            if el.get("elementName") == name:
+                return el
+        return None
+
+    # 從某個 weatherElement 裡挑出「今天」的 parameterName
+    def pick_today_param(el):
+        if not el:
+            return None
+        for t in el.get("time", []):
+            start = t.get("startTime", "")
+            if start.startswith(today_str):
+                p = t.get("parameter", {})
+                return p.get("parameterName")
+        # 找不到今天就用第一筆當 fallback
+        times = el.get("time", [])
+        if times:
+            return times[0].get("parameter", {}).get("parameterName")
+        return None
+
+    def to_int_or_none(s):
+        try:
+            return int(s)
+        except (TypeError, ValueError):
+            return None
+
+    max_temp = to_int_or_none(pick_today_param(pick_element("MaxT")))
+    min_temp = to_int_or_none(pick_today_param(pick_element("MinT")))
+    pop12h = to_int_or_none(pick_today_param(pick_element("PoP12h")))
+    wx_str = pick_today_param(pick_element("Wx"))
+
+    temp_diff = None
+    if max_temp is not None and min_temp is not None:
+        temp_diff = max_temp - min_temp
+
+    return {
+        "maxTemp": max_temp,
+        "minTemp": min_temp,
+        "tempDiff": temp_diff,
+        "pop12h": pop12h,
+        "weatherDesc": wx_str,
+    }
+
+
+class EnvSnapshot:
+    """
+    MOENV AQI 與 CWA 縣市預報的 in-memory 快照（單一 process 用）。
+    - get_* 會在過期時向上游更新（讀取路徑）
+    - lookup_* 只查記憶體，不會打上游（給 feedback 寫入路徑用）
+    更新成功後會呼叫 on_aqi_refresh / on_forecast_refresh 註冊的 callback。
+    多個 gunicorn worker 共用一份快照見 shared_snapshot.SharedEnvSnapshot。
+    """
+
+    def __init__(
+        self,
+        aqi_fetcher: Callable[[], Dict],
+        forecast_fetcher: Callable[[], Dict[str, List[Dict]]],
+    ):
+        self._aqi_fetcher = aqi_fetcher
+        self._forecast_fetcher = forecast_fetcher
+        self._lock = threading.Lock()
+
+        self.aqi_payload: Optional[Dict] = None
+        self.aqi_json: Optional[bytes] = None
+        self.stations: Dict[str, Dict] = {}
+        self.forecasts: Dict[str, List[Dict]] = {}
+        self._aqi_next = 0.0
+        self._forecast_next = 0.0
+        # 每次快照內容更新就 +1（串流 / 衍生資料用來判斷要不要重算）
+        self.version = 0
+
+        self._aqi_listeners: List[Callable[[Dict], None]] = []
+        self._forecast_listeners: List[Callable[[Dict[str, List[Dict]]], None]] = []
+
+    def on_aqi_refresh(self, fn: Callable[[Dict], None]) -> None:
+        self._aqi_listeners.append(fn)
+
+    def on_forecast_refresh(self, fn: Callable[[Dict[str, List[Dict]]], None]) -> None:
+        self._forecast_listeners.append(fn)
+
+    @staticmethod
+    def _notify(listeners, data) -> None:
+        for fn in listeners:
+            try:
+                fn(data)
+            except Exception as e:
+                print("snapshot listener error:", repr(e))
+
+    # ===== 更新 =====
+
+    def _try_lock(self, have_data: bool) -> bool:
+        # 已有舊資料時不排隊等別人更新，直接沿用舊資料
+        return self._lock.acquire(blocking=not have_data)
+
+    def refresh_aqi(self, force: bool = False) -> None:
+        if not force and time.time() < self._aqi_next:
+            return
+        if not self._try_lock(self.aqi_payload is not None):
+            return
+        try:
+            if not force and time.time() < self._aqi_next:
+                return
+            try:
+                payload = self._aqi_fetcher()
+            except Exception as e:
+                print("AQI snapshot refresh 失敗:", repr(e))
+                self._aqi_next = time.time() + RETRY_AFTER_SEC
+                return
+
+            records = payload.get("records") if isinstance(payload, dict) else payload
+            self.aqi_payload = payload
+            self.aqi_json = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.stations = {
+                (r.get("sitename") or r.get("SiteName")): r
+                for r in (records or [])
+                if r.get("sitename") or r.get("SiteName")
+            }
+            self._aqi_next = time.time() + AQI_TTL_SEC
+            self.version += 1
+        finally:
+            self._lock.release()
+
+        self._notify(self._aqi_listeners, payload)
+
+    def refresh_forecast(self, force: bool = False) -> None:
+        if not force and time.time() < self._forecast_next:
+            return
+        if not self._try_lock(bool(self.forecasts)):
+            return
+        try:
+            if not force and time.time() < self._forecast_next:
+                return
+            try:
+                forecasts = self._forecast_fetcher()
+            except Exception as e:
+                print("Forecast snapshot refresh 失敗:", repr(e))
+                self._forecast_next = time.time() + RETRY_AFTER_SEC
+                return
+
+            self.forecasts = forecasts
+            self._forecast_next = time.time() + FORECAST_TTL_SEC
+            self.version += 1
+        finally:
+            self._lock.release()
+
+        self._notify(self._forecast_listeners, forecasts)
+
+    # ===== 讀取路徑（過期就更新）=====
+
+    def get_aqi_json(self) -> Optional[bytes]:
+        """/api/aqi 直接回傳的 JSON bytes"""
+        self.refresh_aqi()
+        return self.aqi_json
+
+    def get_forecast(self, county: str) -> Optional[List[Dict]]:
+        self.refresh_forecast()
+        return self.lookup_forecast(county)
+
+    # ===== 寫入路徑（只查記憶體）=====
+
+    def lookup_station(self, site: str) -> Optional[Dict]:
+        """site 可以是「中山」或前端的「臺北市 中山」格式"""
+        site = (site or "").strip()
+        if not site:
+            return None
+        return self.stations.get(site) or self.stations.get(site.split(" ")[-1])
+
+    def lookup_forecast(self, county: str) -> Optional[List[Dict]]:
+        return self.forecasts.get(normalize_county(county))
+
+    def has_forecasts(self) -> bool:
+        return bool(self.forecasts)
+
+    def station_records(self) -> List[Dict]:
+        return list(self.stations.values())
+
+    def county_names(self) -> List[str]:
+        return list(self.forecasts)
+
+
+FEEDBACK_ENV_FIELDS = ("envAqi", "envMaxTemp", "envMinTemp", "envTempDiff", "envPop12h")
+
+
+def resolve_feedback_env(snapshot: EnvSnapshot, site: str, location_name: str = "") -> Dict:
+    """
+    依測站與縣市從快照算出 feedback 的環境欄位，不打上游，也不收前端算的數值。
+    測站找不到時 AQI 留空，預報改用 location_name（沒給就用「縣市 站名」的縣市部分）；
+    有欄位缺值時 envSource 標成 partial，之後由 env_backfill 用歷史資料補齊。
+    """
+    site = (site or "").strip()
+    station = snapshot.lookup_station(site) if site else None
+
+    aqi = None
+    site_name = ""
+    if station:
+        try:
+            aqi = int(station.get("aqi"))
+        except (TypeError, ValueError):
+            aqi = None
+        site_name = station.get("sitename") or station.get("SiteName") or ""
+
+    site_county = site.split(" ")[0] if " " in site else ""
+    county = normalize_county((station or {}).get("county") or location_name or site_county)
+
+    env = {
+        "envAqi": aqi,
+        "envAqiSite": f"{county} {site_name}".strip() if station else site,
+        "envMaxTemp": None,
+        "envMinTemp": None,
+        "envTempDiff": None,
+        "envPop12h": None,
+    }
+
+    elements = snapshot.lookup_forecast(county) if county else None
+    if elements:
+        today = today_forecast(elements)
+        env["envMaxTemp"] = today["maxTemp"]
+        env["envMinTemp"] = today["minTemp"]
+        env["envTempDiff"] = today["tempDiff"]
+        env["envPop12h"] = today["pop12h"]
+
+    complete = all(env[f] is not None for f in FEEDBACK_ENV_FIELDS)
+    env["envSource"] = "server" if complete else "partial"
+    return env
@@ -0,0 +1,215 @@
+# env_stream.py
+"""
+AQI / 預報的 Server-Sent Events 推播。
+
+前端訂閱 station:<測站> / county:<縣市>（station:* 代表全部測站），
+只有快照更新且該測站 / 縣市的數值真的有變時才會收到事件，不用再定時重打 /api/aqi、/api/weather/today-range。
+
+每個 worker 一個 SnapshotWatcher（第一個訂閱者出現時才啟動）：
+定期呼叫 refresh（多 worker 時只有一個會真的打上游），快照版本變了就做 diff，
+把變動序列化一次後丟進訂閱者各自的 queue。
+連線要撐上千條，請用 gunicorn 的 gevent worker（見 gunicorn.conf.py）。
+"""
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+import json
+import os
+import queue
+import threading
+import time
+
+from env_snapshot import EnvSnapshot, today_forecast
+
+# 多久檢查一次快照（真正打上游的頻率仍由快照 TTL 決定），STREAM_WATCH_SEC 可覆蓋
+DEFAULT_WATCH_INTERVAL_SEC = 30
+# 沒事件時送 comment 保持連線（避開 proxy idle timeout）
+HEARTBEAT_SEC = 15
+# 每個訂閱者最多暫存幾個事件，塞滿代表連線卡住，直接斷掉
+QUEUE_SIZE = 64
+
+STATION_FIELDS = {
+    "aqi": "aqi",
+    "pm2.5": "pm25",
+    "pm10": "pm10",
+    "o3": "o3",
+    "so2": "so2",
+}
+
+
+def _num(v) -> Optional[float]:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def station_reading(record: Dict) -> Dict:
+    """測站 record → 推播用的精簡格式（EnvSnapshot / SharedEnvSnapshot 兩種來源統一）"""
+    reading = {
+        "site": record.get("sitename") or record.get("SiteName") or "",
+        "county": record.get("county") or record.get("County") or "",
+        "publishTime": record.get("publishtime") or record.get("PublishTime") or "",
+        # AQITable 顯示的狀態文字（良好 / 普通…），要跟 aqi 一起更新
+        "status": record.get("status") or record.get("Status") or "",
+    }
+    for src, field in STATION_FIELDS.items():
+        reading[field] = _num(record.get(src))
+    return reading
+
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class Subscription:
+    def __init__(self, topics: Set[str]):
+        self.topics = topics
+        self.queue: "queue.Queue[str]" = queue.Queue(maxsize=QUEUE_SIZE)
+        self.closed = False
+
+
+class Broker:
+    """topic → 訂閱者；publish 時同一份字串丟給所有訂閱者"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._topics: Dict[str, Set[Subscription]] = {}
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        sub = Subscription(set(topics))
+        with self._lock:
+            for t in sub.topics:
+                self._topics.setdefault(t, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            for t in sub.topics:
+                subs = self._topics.get(t)
+                if subs:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._topics[t]
+
+    def has_subscribers(self, topic: str) -> bool:
+        return topic in self._topics
+
+    def publish(self, topic: str, message: str) -> int:
+        with self._lock:
+            subs = list(self._topics.get(topic, ()))
+        for sub in subs:
+            try:
+                sub.queue.put_nowait(message)
+            except queue.Full:
+                # 消化不了的連線直接關掉，前端 EventSource 會自動重連
+                sub.closed = True
+                self.unsubscribe(sub)
+        return len(subs)
+
+
+class SnapshotWatcher:
+    """盯著快照版本，變了就 diff 並推播有變動的測站 / 縣市"""
+
+    def __init__(self, snapshot: EnvSnapshot, broker: Broker, interval_sec: Optional[int] = None):
+        self.snapshot = snapshot
+        self.broker = broker
+        # 建構時才讀環境變數（app.py 的 load_dotenv() 之後）
+        self.interval_sec = (
+            interval_sec if interval_sec is not None
+            else int(os.getenv("STREAM_WATCH_SEC", str(DEFAULT_WATCH_INTERVAL_SEC)))
+        )
+        self._version = -1
+        self._stations: Dict[str, Dict] = {}
+        self._counties: Dict[str, Dict] = {}
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def ensure_started(self) -> None:
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            self.snapshot.refresh_aqi()
+            self.snapshot.refresh_forecast()
+            self.check()  # 先建立 baseline，之後只推變動
+            threading.Thread(target=self._loop, name="env-stream-watcher", daemon=True).start()
+            self._started = True
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(self.interval_sec)
+            try:
+                self.snapshot.refresh_aqi()
+                self.snapshot.refresh_forecast()
+                self.check()
+            except Exception as e:
+                print("env stream watcher error:", repr(e))
+
+    def check(self) -> int:
+        """快照版本變了就 diff，回傳推播出去的事件數"""
+        if self.snapshot.version == self._version:
+            return 0
+        self._version = self.snapshot.version
+
+        sent = 0
+        stations = {}
+        for record in self.snapshot.station_records():
+            reading = station_reading(record)
+            stations[reading["site"]] = reading
+        for site, reading in stations.items():
+            if self._stations.get(site) != reading:
+                topic = f"station:{site}"
+                wildcard = self.broker.has_subscribers("station:*")
+                if wildcard or self.broker.has_subscribers(topic):
+                    message = _sse("station", reading)
+                    self.broker.publish(topic, message)
+                    if wildcard:
+                        self.broker.publish("station:*", message)
+                    sent += 1
+        self._stations = stations
+
+        counties = {}
+        for county in self.snapshot.county_names():
+            elements = self.snapshot.lookup_forecast(county)
+            if elements:
+                counties[county] = {"locationName": county, **today_forecast(elements)}
+        for county, forecast in counties.items():
+            if self._counties.get(county) != forecast:
+                topic = f"county:{county}"
+                if self.broker.has_subscribers(topic):
+                    self.broker.publish(topic, _sse("county", forecast))
+                    sent += 1
+        self._counties = counties
+        return sent
+
+    def current_events(self, topics: Iterable[str]) -> List[str]:
+        """剛連上時先送一次目前的值"""
+        events = []
+        for t in topics:
+            kind, _, key = t.partition(":")
+            if kind == "station" and key == "*":
+                events.extend(_sse("station", r) for r in self._stations.values())
+            elif kind == "station" and key in self._stations:
+                events.append(_sse("station", self._stations[key]))
+            elif kind == "county" and key in self._counties:
+                events.append(_sse("county", self._counties[key]))
+        return events
+
+
+def stream_events(watcher: SnapshotWatcher, topics: List[str]) -> Iterator[str]:
+    """SSE generator：先送目前值，之後只送變動，閒置時送 heartbeat"""
+    watcher.ensure_started()
+    sub = watcher.broker.subscribe(topics)
+    try:
+        yield "retry: 5000\n\n"
+        for event in watcher.current_events(topics):
+            yield event
+        while not sub.closed:
+            try:
+                message = sub.queue.get(timeout=HEARTBEAT_SEC)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield message
+    finally:
+        watcher.broker.unsubscribe(sub)
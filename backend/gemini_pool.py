@@ -0,0 +1,162 @@
+# gemini_pool.py
+"""
+伺服器端的 Gemini API key pool。
+
+GEMINI_API_KEYS=key1,key2,... 設定後，AI 建議改用伺服器的 key（使用者不必再帶 geminiApiKey）。
+每把 key 在 60 秒滑動視窗內追蹤 request 數與 token 數，每次挑「最空」的 key；
+全部滿了就排隊等（最多 GEMINI_POOL_MAX_WAIT_SEC 秒），等不到就丟 PoolSaturated 讓呼叫端 fallback。
+某把 key 被 Gemini 回 429 時，依 Retry-After 冷卻後換下一把重試。
+
+多個 gunicorn worker 各自有一個 pool，所以每個 process 只分到
+GEMINI_KEY_RPM / GEMINI_KEY_TPM 除以 worker 數的額度。
+"""
+from typing import Deque, List, Optional, Tuple
+from collections import deque
+import os
+import threading
+import time
+from requests.exceptions import HTTPError
+
+from ai_gemini import call_gemini, DEFAULT_GEMINI_MODEL
+
+WINDOW_SEC = 60
+# 沒有 usage 資訊，用 prompt 長度粗估：約 4 字元 1 token，加上回覆的量
+OUTPUT_TOKENS_ESTIMATE = 256
+DEFAULT_COOLDOWN_SEC = 30
+
+
+class PoolSaturated(Exception):
+    """所有 key 都滿了（或都在冷卻），且等待超過上限"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Gemini key pool saturated, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def estimate_tokens(prompt: str) -> int:
+    return len(prompt) // 4 + OUTPUT_TOKENS_ESTIMATE
+
+
+class _KeyState:
+    def __init__(self, key: str):
+        self.key = key
+        self.requests: Deque[float] = deque()
+        self.tokens: Deque[Tuple[float, int]] = deque()
+        self.token_sum = 0
+        self.cooldown_until = 0.0
+
+    def expire(self, now: float) -> None:
+        while self.requests and self.requests[0] <= now - WINDOW_SEC:
+            self.requests.popleft()
+        while self.tokens and self.tokens[0][0] <= now - WINDOW_SEC:
+            self.token_sum -= self.tokens.popleft()[1]
+
+    def next_free_at(self, now: float, rpm: int, tpm: int, need: int) -> float:
+        """這把 key 最早什麼時候可以再送一個 need token 的 request"""
+        t = max(now, self.cooldown_until)
+        if len(self.requests) >= rpm:
+            t = max(t, self.requests[len(self.requests) - rpm] + WINDOW_SEC)
+        if self.token_sum + need > tpm and self.tokens:
+            freed = 0
+            for ts, n in self.tokens:
+                freed += n
+                if self.token_sum - freed + need <= tpm:
+                    t = max(t, ts + WINDOW_SEC)
+                    break
+        return t
+
+
+class GeminiKeyPool:
+    def __init__(self, keys: List[str], rpm: int, tpm: int, max_wait_sec: float):
+        self._keys = [_KeyState(k) for k in keys]
+        self.rpm = max(1, rpm)
+        self.tpm = max(1, tpm)
+        self.max_wait_sec = max_wait_sec
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_env(cls) -> Optional["GeminiKeyPool"]:
+        keys = [k.strip() for k in os.getenv("GEMINI_API_KEYS", "").split(",") if k.strip()]
+        if not keys:
+            return None
+        # gunicorn.conf.py 會把實際的 worker 數寫進 WEB_CONCURRENCY；沒設時用同一個預設值
+        workers = max(1, int(os.getenv("WEB_CONCURRENCY", "2")))
+        # 預設值是 gemini-2.5-flash-lite 免費額度
+        rpm = int(os.getenv("GEMINI_KEY_RPM", "15")) // workers
+        tpm = int(os.getenv("GEMINI_KEY_TPM", "250000")) // workers
+        max_wait = float(os.getenv("GEMINI_POOL_MAX_WAIT_SEC", "10"))
+        return cls(keys, rpm, tpm, max_wait)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    # ===== 排程 =====
+
+    def _load(self, k: _KeyState) -> float:
+        return len(k.requests) / self.rpm + k.token_sum / self.tpm
+
+    def acquire(self, need_tokens: int, timeout: Optional[float] = None) -> _KeyState:
+        """挑最空的 key 並先記帳；全滿就等，超過 timeout 丟 PoolSaturated"""
+        timeout = self.max_wait_sec if timeout is None else timeout
+        deadline = time.time() + timeout
+        need_tokens = min(need_tokens, self.tpm)
+
+        with self._cond:
+            while True:
+                now = time.time()
+                for k in self._keys:
+                    k.expire(now)
+                ready = [
+                    k for k in self._keys
+                    if k.next_free_at(now, self.rpm, self.tpm, need_tokens) <= now
+                ]
+                if ready:
+                    k = min(ready, key=self._load)
+                    k.requests.append(now)
+                    k.tokens.append((now, need_tokens))
+                    k.token_sum += need_tokens
+                    return k
+
+                free_at = min(k.next_free_at(now, self.rpm, self.tpm, need_tokens) for k in self._keys)
+                if free_at > deadline:
+                    raise PoolSaturated(free_at - now)
+                self._cond.wait(timeout=max(0.05, free_at - now))
+
+    def mark_rate_limited(self, k: _KeyState, retry_after: Optional[float]) -> None:
+        with self._cond:
+            k.cooldown_until = time.time() + (retry_after or DEFAULT_COOLDOWN_SEC)
+            self._cond.notify_all()
+
+    # ===== 呼叫 Gemini =====
+
+    def generate(
+        self,
+        prompt: str,
+        expected_lines: Optional[int] = None,
+        model: str = DEFAULT_GEMINI_MODEL,
+    ) -> List[str]:
+        """用 pool 裡的 key 呼叫 Gemini；429 就冷卻該 key 換下一把，最多每把試一次"""
+        need = estimate_tokens(prompt)
+        deadline = time.time() + self.max_wait_sec
+        last_retry_after = float(DEFAULT_COOLDOWN_SEC)
+
+        for _ in range(len(self._keys)):
+            k = self.acquire(need, timeout=max(0.0, deadline - time.time()))
+            try:
+                return call_gemini(k.key, prompt, model=model, expected_lines=expected_lines)
+            except HTTPError as e:
+                resp = e.response
+                if resp is None or resp.status_code != 429:
+                    raise
+                retry_after = _retry_after(resp)
+                last_retry_after = retry_after or last_retry_after
+                self.mark_rate_limited(k, retry_after)
+
+        raise PoolSaturated(last_retry_after)
+
+
+def _retry_after(resp) -> Optional[float]:
+    try:
+        return float(resp.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,16 @@
+# gunicorn.conf.py
+# gunicorn 啟動時會自動讀取這個檔案（在 backend/ 底下執行 gunicorn app:app）
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+# 寫回環境變數讓 worker 看得到實際的 worker 數（gemini_pool 依此平分每把 key 的額度）
+os.environ.setdefault("WEB_CONCURRENCY", "2")
+workers = int(os.environ["WEB_CONCURRENCY"])
+
+# /api/stream 是長連線（SSE），用 gevent 讓每個 worker 可以同時掛上千條連線
+worker_class = "gevent"
+worker_connections = int(os.getenv("WORKER_CONNECTIONS", "2000"))
+
+# SSE 連線會一直開著，timeout 只用來偵測卡死的 worker
+timeout = 120
+graceful_timeout = 30
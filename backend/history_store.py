@@ -0,0 +1,371 @@
+# history_store.py
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import queue
+import threading
+import time
+from pymongo import UpdateOne, errors
+
+from mongo import claim_run
+
+TAIPEI_TZ = timezone(timedelta(hours=8))
+
+# ===== 保存層級（retention tiers）=====
+# 每個 (kind, key, 日期) 一份 bucket 文件：
+# - 最近 HOURLY_RETENTION_DAYS 天：保留 hours.HH 逐時數值
+# - 超過後壓縮成 summary（每個指標的 sum / count / min / max），刪掉逐時資料
+# - 超過 DAILY_RETENTION_DAYS 天：整份 bucket 由 TTL index 自動刪除
+HOURLY_RETENTION_DAYS = 90
+DAILY_RETENTION_DAYS = 730
+
+# MOENV 欄位 → 儲存欄位（Mongo key 不能有 "."）
+AQI_METRICS = {
+    "aqi": "aqi",
+    "pm2.5": "pm25",
+    "pm10": "pm10",
+    "o3": "o3",
+}
+
+# F-C0032-001 elementName → 儲存欄位
+FORECAST_METRICS = {
+    "MaxT": "maxTemp",
+    "MinT": "minTemp",
+    "PoP12h": "pop12h",
+}
+
+# 查詢可用的 step（秒）
+STEP_SECONDS = {
+    "1h": 3600,
+    "3h": 3 * 3600,
+    "6h": 6 * 3600,
+    "12h": 12 * 3600,
+    "1d": 86400,
+    "1w": 7 * 86400,
+}
+
+# bucket 對齊基準：1970-01-05 是星期一，讓 1w 從週一開始、1d 從台灣午夜開始
+_ALIGN_EPOCH = datetime(1970, 1, 5)
+
+# 每種資料上一次寫入的快照簽章，避免同一份快照被重複寫入
+_last_ingested: Dict[str, str] = {}
+
+
+def ensure_history_indexes(col) -> None:
+    """建立 bucket 唯一鍵與 TTL index。"""
+    col.create_index([("kind", 1), ("key", 1), ("day", 1)], unique=True)
+    col.create_index("date", expireAfterSeconds=DAILY_RETENTION_DAYS * 86400)
+
+
+def _to_float_or_none(v) -> Optional[float]:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_local_time(s: str) -> Optional[datetime]:
+    """解析 MOENV / CWA 的時間字串（台灣時間），回傳 naive 的台灣當地時間。"""
+    if not s:
+        return None
+    s = s.strip().replace("/", "-").replace("T", " ")
+    s = s.split("+")[0]
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def _bucket_update(kind: str, key: str, local_ts: datetime, values: Dict) -> UpdateOne:
+    day = local_ts.strftime("%Y-%m-%d")
+    # date 存成 UTC，TTL 與範圍查詢都用它
+    day_start = datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=TAIPEI_TZ)
+    return UpdateOne(
+        {"kind": kind, "key": key, "day": day},
+        {
+            "$set": {
+                f"hours.{local_ts.strftime('%H')}": values,
+                "updatedAt": datetime.utcnow(),
+            },
+            "$setOnInsert": {"date": day_start.astimezone(timezone.utc).replace(tzinfo=None)},
+        },
+        upsert=True,
+    )
+
+
+def _write(col, kind: str, signature: str, ops: List[UpdateOne]) -> int:
+    if not ops or _last_ingested.get(kind) == signature:
+        return 0
+    try:
+        col.bulk_write(ops, ordered=False)
+    except errors.BulkWriteError as e:
+        print("history bulk write error:", e.details.get("writeErrors", [])[:3])
+    _last_ingested[kind] = signature
+    return len(ops)
+
+
+def aqi_records_from_payload(payload) -> List[Dict]:
+    """MOENV v2 回傳可能是 {"records": [...]} 或直接是 list。"""
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict):
+        return payload.get("records") or []
+    return []
+
+
+def ingest_aqi_snapshot(col, payload) -> int:
+    """
+    把一份 MOENV aqx_p_432 快照寫進 history。
+    每個測站依 publishtime 放進當天 bucket 的 hours.HH，重複寫入是 idempotent 的。
+    回傳寫入的測站筆數（快照沒變則為 0）。
+    """
+    ops = []
+    latest = ""
+    for r in aqi_records_from_payload(payload):
+        site = r.get("sitename") or r.get("SiteName")
+        publish = r.get("publishtime") or r.get("PublishTime") or ""
+        ts = _parse_local_time(publish)
+        if not site or ts is None:
+            continue
+
+        values = {
+            field: _to_float_or_none(r.get(src))
+            for src, field in AQI_METRICS.items()
+        }
+        ops.append(_bucket_update("aqi", site, ts, values))
+        latest = max(latest, publish)
+
+    return _write(col, "aqi", f"{latest}:{len(ops)}", ops)
+
+
+def ingest_forecast_snapshot(col, location_name: str, weather_elements: List[Dict]) -> int:
+    """
+    把 F-C0032-001 單一縣市的 weatherElement 寫進 history。
+    每個 12 小時時段依 startTime 放進對應日期的 hours.HH。
+    """
+    slots: Dict[str, Dict] = {}
+    for el in weather_elements:
+        field = FORECAST_METRICS.get(el.get("elementName"))
+        if not field:
+            continue
+        for t in el.get("time", []):
+            start = t.get("startTime", "")
+            value = _to_float_or_none((t.get("parameter") or {}).get("parameterName"))
+            slots.setdefault(start, {})[field] = value
+
+    ops = []
+    for start, values in slots.items():
+        ts = _parse_local_time(start)
+        if ts is not None:
+            ops.append(_bucket_update("forecast", location_name, ts, values))
+
+    return _write(col, f"forecast:{location_name}", repr(sorted(slots.items())), ops)
+
+
+# ========== 壓縮（逐時 → 每日 summary）==========
+
+def _summarize(hours: Dict[str, Dict]) -> Dict[str, Dict]:
+    summary: Dict[str, Dict] = {}
+    for values in hours.values():
+        for field, v in (values or {}).items():
+            if v is None:
+                continue
+            s = summary.setdefault(field, {"sum": 0.0, "count": 0, "min": v, "max": v})
+            s["sum"] += v
+            s["count"] += 1
+            s["min"] = min(s["min"], v)
+            s["max"] = max(s["max"], v)
+    return summary
+
+
+def compact_history(col, now: Optional[datetime] = None) -> int:
+    """把超過 HOURLY_RETENTION_DAYS 的 bucket 壓縮成每日 summary，回傳處理筆數。"""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=HOURLY_RETENTION_DAYS)
+
+    ops = []
+    total = 0
+    cursor = col.find(
+        {"date": {"$lt": cutoff}, "hours": {"$exists": True}},
+        {"hours": 1},
+    )
+    for doc in cursor:
+        ops.append(UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {"summary": _summarize(doc.get("hours") or {})}, "$unset": {"hours": ""}},
+        ))
+        if len(ops) >= 500:
+            col.bulk_write(ops, ordered=False)
+            total += len(ops)
+            ops = []
+    if ops:
+        col.bulk_write(ops, ordered=False)
+        total += len(ops)
+    return total
+
+
+def start_compaction_scheduler(db, col, interval_sec: int) -> threading.Thread:
+    """背景 thread：每 interval_sec 秒壓縮一次（多個 worker 只有一個實際執行）"""
+    def loop():
+        while True:
+            try:
+                if claim_run(db["analytics_runs"], "history_compaction", interval_sec):
+                    print("history compaction:", compact_history(col))
+            except Exception as e:
+                print("history compaction error:", repr(e))
+            time.sleep(min(interval_sec, 300))
+
+    t = threading.Thread(target=loop, name="history-compaction", daemon=True)
+    t.start()
+    return t
+
+
+# ========== 背景寫入 ==========
+
+class HistoryIngester:
+    """
+    快照 refresh callback 只把資料放進 queue，由背景 thread 寫進 history。
+    refresh 會在使用者的 request（/api/aqi、SSE watcher…）裡觸發，不能讓它等 Mongo。
+    thread 在第一次 submit 時才啟動（gunicorn fork 之後）。
+    """
+
+    def __init__(self, col, maxsize: int = 8):
+        self.col = col
+        self._queue: "queue.Queue[Tuple[str, object]]" = queue.Queue(maxsize=maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit_aqi(self, payload) -> None:
+        self._put(("aqi", payload))
+
+    def submit_forecasts(self, forecasts: Dict[str, List[Dict]]) -> None:
+        self._put(("forecast", forecasts))
+
+    def _put(self, item: Tuple[str, object]) -> None:
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Mongo 卡住時寧可丟掉這份快照（下一份會再寫同一個 hours.HH）
+            print("history ingest queue full, dropped", item[0])
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="history-ingest", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            kind, data = self._queue.get()
+            try:
+                if kind == "aqi":
+                    ingest_aqi_snapshot(self.col, data)
+                else:
+                    for county, elements in data.items():
+                        ingest_forecast_snapshot(self.col, county, elements)
+            except Exception as e:
+                print("history ingest error:", repr(e))
+
+
+# ========== 範圍查詢（downsample）==========
+
+def default_step(start: datetime, end: datetime) -> str:
+    span = end - start
+    if span <= timedelta(days=3):
+        return "1h"
+    if span <= timedelta(days=31):
+        return "6h"
+    return "1d"
+
+
+def _bucket_start(local_ts: datetime, step_sec: int) -> datetime:
+    offset = int((local_ts - _ALIGN_EPOCH).total_seconds()) // step_sec * step_sec
+    return _ALIGN_EPOCH + timedelta(seconds=offset)
+
+
+def query_history(
+    col,
+    kind: str,
+    key: str,
+    start: datetime,
+    end: datetime,
+    step: str,
+) -> List[Dict]:
+    """
+    查詢 [start, end]（naive 台灣時間）內的資料，依 step 做平均。
+    逐時 bucket 用 hours 逐筆累加；已壓縮的 bucket 用 summary 的 sum/count，
+    並視為落在當天 00:00。
+    回傳 [{"time": "2025-12-11T06:00:00+08:00", "samples": n, "<field>": mean, ...}]
+    """
+    step_sec = STEP_SECONDS[step]
+
+    first_day = datetime(start.year, start.month, start.day, tzinfo=TAIPEI_TZ)
+    date_from = first_day.astimezone(timezone.utc).replace(tzinfo=None)
+    date_to = end.replace(tzinfo=TAIPEI_TZ).astimezone(timezone.utc).replace(tzinfo=None)
+
+    cursor = col.find(
+        {"kind": kind, "key": key, "date": {"$gte": date_from, "$lte": date_to}},
+        {"day": 1, "hours": 1, "summary": 1},
+    )
+
+    acc: Dict[datetime, Dict] = {}
+
+    def add(ts: datetime, field: str, total: float, count: int):
+        b = acc.setdefault(_bucket_start(ts, step_sec), {"samples": 0, "fields": {}})
+        f = b["fields"].setdefault(field, [0.0, 0])
+        f[0] += total
+        f[1] += count
+
+    for doc in cursor:
+        day = datetime.strptime(doc["day"], "%Y-%m-%d")
+        hours = doc.get("hours")
+        if hours:
+            for hh, values in hours.items():
+                ts = day + timedelta(hours=int(hh))
+                if not (start <= ts <= end):
+                    continue
+                acc.setdefault(_bucket_start(ts, step_sec), {"samples": 0, "fields": {}})["samples"] += 1
+                for field, v in (values or {}).items():
+                    if v is not None:
+                        add(ts, field, v, 1)
+        elif doc.get("summary") and start <= day <= end:
+            summary = doc["summary"]
+            n = max((s.get("count", 0) for s in summary.values()), default=0)
+            acc.setdefault(_bucket_start(day, step_sec), {"samples": 0, "fields": {}})["samples"] += n
+            for field, s in summary.items():
+                add(day, field, s.get("sum", 0.0), s.get("count", 0))
+
+    points = []
+    for bucket in sorted(acc):
+        b = acc[bucket]
+        point = {
+            "time": bucket.replace(tzinfo=TAIPEI_TZ).isoformat(),
+            "samples": b["samples"],
+        }
+        for field, (total, count) in b["fields"].items():
+            point[field] = round(total / count, 1) if count else None
+        points.append(point)
+    return points
+
+
+def parse_range_args(
+    from_str: Optional[str],
+    to_str: Optional[str],
+    default_days: int = 7,
+) -> Optional[Tuple[datetime, datetime]]:
+    """把 ?from=&to= 轉成 naive 台灣時間，格式錯誤回傳 None。"""
+    now_local = datetime.now(TAIPEI_TZ).replace(tzinfo=None)
+
+    end = _parse_local_time(to_str) if to_str else now_local
+    if to_str and end is not None and len(to_str.strip()) == 10:
+        # 只給日期時，包含當天整天
+        end = end + timedelta(days=1) - timedelta(seconds=1)
+    start = _parse_local_time(from_str) if from_str else (end - timedelta(days=default_days) if end else None)
+
+    if start is None or end is None or start > end:
+        return None
+    return start, end
@@ -0,0 +1,106 @@
+# mongo.py
+"""
+延遲建立的 MongoDB 連線。
+
+import app 時不連線（mongodb+srv 的 DNS 查詢、create_index 都會卡住 worker 開機），
+collection 先拿到 LazyCollection，第一次真正使用時才建 MongoClient。
+index 建立等啟動工作註冊到 on_warm_up()，由背景 thread 執行，
+進度可用 readiness() 查（/api/ready）。
+"""
+from typing import Callable, Dict, List, Optional
+from datetime import datetime, timedelta
+import os
+import threading
+import time
+from pymongo import MongoClient, ReturnDocument, errors
+
+DB_NAME = "BreezyDay"
+
+_client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
+
+_warm_up_tasks: List[Callable[[], None]] = []
+_state: Dict = {"status": "pending", "error": None, "readyAt": None}
+
+
+def get_client() -> MongoClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(os.getenv("MONGO_URI"))
+    return _client
+
+
+class LazyCollection:
+    """看起來像 pymongo Collection，第一次呼叫方法時才取得真正的 collection"""
+
+    def __init__(self, db_name: str, name: str):
+        self._db_name = db_name
+        self._name = name
+
+    def _resolve(self):
+        return get_client()[self._db_name][self._name]
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self._db_name}.{self._name})"
+
+
+class LazyDatabase:
+    def __init__(self, name: str = DB_NAME):
+        self.name = name
+
+    def __getitem__(self, collection: str) -> LazyCollection:
+        return LazyCollection(self.name, collection)
+
+
+def claim_run(runs_col, name: str, interval_sec: int) -> bool:
+    """多個 worker 的背景排程用 findOneAndUpdate 搶這一輪的執行權"""
+    now = datetime.utcnow()
+    try:
+        doc = runs_col.find_one_and_update(
+            {"_id": name, "lastRunAt": {"$lt": now - timedelta(seconds=interval_sec)}},
+            {"$set": {"lastRunAt": now}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except errors.DuplicateKeyError:
+        # 文件存在但還沒到時間，upsert 撞到 _id
+        return False
+    return doc is not None
+
+
+def on_warm_up(fn: Callable[[], None]) -> Callable[[], None]:
+    """註冊啟動工作（例如建 index），可當 decorator 用"""
+    _warm_up_tasks.append(fn)
+    return fn
+
+
+def warm_up(max_backoff_sec: int = 60) -> None:
+    """ping MongoDB 並執行所有啟動工作；失敗就 backoff 重試直到成功"""
+    backoff = 2
+    while True:
+        try:
+            get_client().admin.command("ping")
+            for task in _warm_up_tasks:
+                task()
+            _state.update(status="ready", error=None, readyAt=time.time())
+            return
+        except Exception as e:
+            _state.update(status="error", error=repr(e))
+            print("Mongo warm-up 失敗，稍後重試:", repr(e))
+            time.sleep(backoff)
+            backoff = min(backoff * 2, max_backoff_sec)
+
+
+def start_warm_up() -> threading.Thread:
+    t = threading.Thread(target=warm_up, name="mongo-warm-up", daemon=True)
+    t.start()
+    return t
+
+
+def readiness() -> Dict:
+    return dict(_state)
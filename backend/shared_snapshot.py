@@ -0,0 +1,385 @@
+# shared_snapshot.py
+"""
+多個 gunicorn worker 共用的 AQI / 預報快照。
+
+一個 worker 拿到 flock 後負責打上游，把結果寫成一份有版本號的二進位檔，
+再用 os.replace 原子替換；所有 worker 以 mmap 讀同一份檔案（page cache 共用），
+測站表用 np.frombuffer 直接在 mmap 上建 view，不會複製。
+
+檔案格式（little-endian）：
+    header : magic | version | aqiNext | forecastNext | 5 個 section 的 (offset, length)
+    AQI_JSON       : /api/aqi 原樣回傳的 JSON bytes
+    STATIONS       : STATION_DTYPE 的結構化陣列
+    STRINGS        : 測站名稱、縣市、發布時間、狀態（UTF-8，STATIONS 以 offset/length 指向這裡）
+    FORECAST_JSON  : 各縣市 weatherElement 的 JSON，逐縣市串接
+    FORECAST_INDEX : {縣市: [offset, length]}（相對 FORECAST_JSON）
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import math
+import mmap
+import os
+import struct
+import tempfile
+import time
+import numpy as np
+
+from env_snapshot import (
+    EnvSnapshot, AQI_TTL_SEC, FORECAST_TTL_SEC, RETRY_AFTER_SEC, normalize_county,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows 本機開發：退回單一 process 的 EnvSnapshot
+    fcntl = None
+
+# 測站表欄位有變就換 magic，舊格式的檔案會被忽略並重新抓
+MAGIC = b"BRZSNAP2"
+AQI_JSON, STATIONS, STRINGS, FORECAST_JSON, FORECAST_INDEX = range(5)
+N_SECTIONS = 5
+HEADER = struct.Struct("<8sQdd" + "QQ" * N_SECTIONS)
+# header 裡 aqiNext / forecastNext 的位置：上游失敗時只原地改這 16 bytes，不換檔、不升版本
+DUE = struct.Struct("<dd")
+DUE_OFFSET = struct.calcsize("<8sQ")
+
+STATION_DTYPE = np.dtype([
+    ("name_off", "<u4"), ("name_len", "<u2"),
+    ("county_off", "<u4"), ("county_len", "<u2"),
+    ("publish_off", "<u4"), ("publish_len", "<u2"),
+    ("status_off", "<u4"), ("status_len", "<u2"),
+    ("lat", "<f8"), ("lon", "<f8"),
+    ("aqi", "<f8"), ("pm25", "<f8"), ("pm10", "<f8"), ("o3", "<f8"), ("so2", "<f8"),
+])
+
+# 同一個 worker 多久 stat 一次檔案看有沒有新版本
+SYNC_INTERVAL_SEC = 1.0
+
+
+def _to_float(v) -> float:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _encode_stations(records: List[Dict]) -> Tuple[bytes, bytes]:
+    """MOENV records → (STATIONS, STRINGS) 兩個 section"""
+    strings = bytearray()
+
+    def put(s: str) -> Tuple[int, int]:
+        b = (s or "").encode("utf-8")
+        off = len(strings)
+        strings.extend(b)
+        return off, len(b)
+
+    rows = np.zeros(len(records), dtype=STATION_DTYPE)
+    for i, r in enumerate(records):
+        rows[i]["name_off"], rows[i]["name_len"] = put(r.get("sitename") or r.get("SiteName") or "")
+        rows[i]["county_off"], rows[i]["county_len"] = put(r.get("county") or r.get("County") or "")
+        rows[i]["publish_off"], rows[i]["publish_len"] = put(r.get("publishtime") or r.get("PublishTime") or "")
+        rows[i]["status_off"], rows[i]["status_len"] = put(r.get("status") or r.get("Status") or "")
+        rows[i]["lat"] = _to_float(r.get("latitude"))
+        rows[i]["lon"] = _to_float(r.get("longitude"))
+        rows[i]["aqi"] = _to_float(r.get("aqi") or r.get("AQI"))
+        rows[i]["pm25"] = _to_float(r.get("pm2.5"))
+        rows[i]["pm10"] = _to_float(r.get("pm10"))
+        rows[i]["o3"] = _to_float(r.get("o3"))
+        rows[i]["so2"] = _to_float(r.get("so2"))
+    return rows.tobytes(), bytes(strings)
+
+
+def _encode_forecasts(forecasts: Dict[str, List[Dict]]) -> Tuple[bytes, bytes]:
+    """{縣市: weatherElement} → (FORECAST_JSON, FORECAST_INDEX)"""
+    blob = bytearray()
+    index = {}
+    for county, elements in forecasts.items():
+        b = json.dumps(elements, ensure_ascii=False).encode("utf-8")
+        index[county] = [len(blob), len(b)]
+        blob.extend(b)
+    return bytes(blob), json.dumps(index, ensure_ascii=False).encode("utf-8")
+
+
+class SharedEnvSnapshot(EnvSnapshot):
+    """
+    與 EnvSnapshot 相同的介面，但資料放在 mmap 共享檔案裡。
+    - 讀取：每個 worker 只保留 mmap + 測站名稱索引（小 dict），記憶體不隨 worker 數增加
+    - 更新：flock 保證同時間只有一個 worker 打上游；其他 worker 沿用舊版本
+    - on_*_refresh callback 只在實際打上游的那個 worker 執行（例如歷史資料只寫一次）
+    """
+
+    def __init__(
+        self,
+        aqi_fetcher: Callable[[], Dict],
+        forecast_fetcher: Callable[[], Dict[str, List[Dict]]],
+        path: str,
+    ):
+        super().__init__(aqi_fetcher, forecast_fetcher)
+        self.path = path
+        self._lock_path = path + ".lock"
+
+        self._mm: Optional[mmap.mmap] = None
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._next_sync = 0.0
+        self._sections: List[Tuple[int, int]] = [(0, 0)] * N_SECTIONS
+        self.version = 0
+        self._aqi_due = 0.0
+        self._forecast_due = 0.0
+
+        self._rows: Optional[np.ndarray] = None
+        self._site_index: Dict[str, int] = {}
+        self._forecast_index: Dict[str, List[int]] = {}
+        self._forecast_cache: Dict[str, List[Dict]] = {}
+
+    # ===== mmap 讀取 =====
+
+    def _sync(self, force: bool = False) -> None:
+        """檔案被替換（新版本）就重新 mmap，並重建小型索引"""
+        now = time.time()
+        if not force and now < self._next_sync:
+            return
+        self._next_sync = now + SYNC_INTERVAL_SEC
+
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        file_id = (st.st_ino, st.st_mtime_ns)
+        if file_id == self._file_id:
+            return
+        if self._mm is not None and self._file_id is not None and st.st_ino == self._file_id[0]:
+            # 同一個檔案只有 header 的重試時間被改（_write_due），資料與索引都不用重建
+            self._aqi_due, self._forecast_due = DUE.unpack_from(self._mm, DUE_OFFSET)
+            self._file_id = file_id
+            return
+
+        with open(self.path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        fields = HEADER.unpack_from(mm, 0)
+        if fields[0] != MAGIC:
+            print("shared snapshot: bad magic, ignored")
+            return
+
+        version, aqi_due, forecast_due = fields[1], fields[2], fields[3]
+        sections = [(fields[4 + 2 * i], fields[5 + 2 * i]) for i in range(N_SECTIONS)]
+
+        off, length = sections[STATIONS]
+        rows = np.frombuffer(mm, dtype=STATION_DTYPE, count=length // STATION_DTYPE.itemsize, offset=off)
+        s_off = sections[STRINGS][0]
+        site_index = {
+            bytes(mm[s_off + r["name_off"]: s_off + r["name_off"] + r["name_len"]]).decode("utf-8"): i
+            for i, r in enumerate(rows)
+        }
+        f_off, f_len = sections[FORECAST_INDEX]
+        forecast_index = json.loads(mm[f_off: f_off + f_len] or b"{}")
+
+        # 舊的 mmap 不主動 close：可能還有 np.frombuffer 的 view 在用，交給 GC
+        self._mm = mm
+        self._file_id = file_id
+        self._sections = sections
+        self.version = version
+        self._aqi_due = aqi_due
+        self._forecast_due = forecast_due
+        self._rows = rows
+        self._site_index = site_index
+        self._forecast_index = forecast_index
+        self._forecast_cache = {}
+
+    def _section(self, idx: int) -> bytes:
+        off, length = self._sections[idx]
+        if self._mm is None or not length:
+            return b""
+        return self._mm[off: off + length]
+
+    def _string(self, off: int, length: int) -> str:
+        base = self._sections[STRINGS][0]
+        return self._mm[base + off: base + off + length].decode("utf-8")
+
+    def _aqi_view(self) -> Optional[memoryview]:
+        off, length = self._sections[AQI_JSON]
+        if self._mm is None or not length:
+            return None
+        return memoryview(self._mm)[off: off + length]
+
+    # ===== 寫入（只有拿到 flock 的 worker 會執行）=====
+
+    def _write_due(self, aqi_due: float, forecast_due: float) -> None:
+        """上游失敗：只把下次嘗試時間寫進現有檔案的 header，版本號不變（不觸發重算 / 推播 / 重新輸出）"""
+        with open(self.path, "r+b") as f:
+            f.seek(DUE_OFFSET)
+            f.write(DUE.pack(aqi_due, forecast_due))
+        self._aqi_due, self._forecast_due = aqi_due, forecast_due
+
+    def _write(self, aqi_json: bytes, stations: bytes, strings: bytes,
+               forecast_json: bytes, forecast_index: bytes,
+               aqi_due: float, forecast_due: float) -> None:
+        sections = [aqi_json, stations, strings, forecast_json, forecast_index]
+        table = []
+        # STATIONS 需要對齊，所有 section 都對齊到 8 bytes
+        pos = HEADER.size
+        for b in sections:
+            pos = (pos + 7) // 8 * 8
+            table.append((pos, len(b)))
+            pos += len(b)
+
+        header = HEADER.pack(
+            MAGIC, self.version + 1, aqi_due, forecast_due,
+            *[v for pair in table for v in pair],
+        )
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", prefix=".snapshot-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                for (off, _), b in zip(table, sections):
+                    f.seek(off)
+                    f.write(b)
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        self._sync(force=True)
+
+    def _refresh(self, kind: str, force: bool) -> None:
+        self._sync()
+        due = self._aqi_due if kind == "aqi" else self._forecast_due
+        if not force and time.time() < due:
+            return
+
+        have_data = self._mm is not None
+        lock_fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                # 已有舊資料就不排隊，讓正在更新的 worker 去做
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | (fcntl.LOCK_NB if have_data else 0))
+            except BlockingIOError:
+                return
+
+            # 等鎖期間別的 worker 可能已經更新好了（或剛寫了重試時間）
+            self._sync(force=True)
+            if self._mm is not None:
+                self._aqi_due, self._forecast_due = DUE.unpack_from(self._mm, DUE_OFFSET)
+            due = self._aqi_due if kind == "aqi" else self._forecast_due
+            if not force and time.time() < due:
+                return
+
+            aqi_json = self._section(AQI_JSON)
+            stations, strings = self._section(STATIONS), self._section(STRINGS)
+            forecast_json, forecast_index = self._section(FORECAST_JSON), self._section(FORECAST_INDEX)
+            aqi_due, forecast_due = self._aqi_due, self._forecast_due
+            fetched = None
+
+            try:
+                if kind == "aqi":
+                    fetched = self._aqi_fetcher()
+                    records = fetched.get("records") if isinstance(fetched, dict) else fetched
+                    aqi_json = json.dumps(fetched, ensure_ascii=False).encode("utf-8")
+                    stations, strings = _encode_stations(records or [])
+                    aqi_due = time.time() + AQI_TTL_SEC
+                else:
+                    fetched = self._forecast_fetcher()
+                    forecast_json, forecast_index = _encode_forecasts(fetched)
+                    forecast_due = time.time() + FORECAST_TTL_SEC
+            except Exception as e:
+                print(f"Shared snapshot {kind} refresh 失敗:", repr(e))
+                fetched = None
+                # 把下次嘗試時間寫進檔案，其他 worker 也不會馬上重打
+                if kind == "aqi":
+                    aqi_due = time.time() + RETRY_AFTER_SEC
+                else:
+                    forecast_due = time.time() + RETRY_AFTER_SEC
+
+            if fetched is None and have_data:
+                self._write_due(aqi_due, forecast_due)
+            else:
+                # 第一次（還沒有檔案）就算失敗也要寫一份，重試時間才能跨 worker 共用
+                self._write(aqi_json, stations, strings, forecast_json, forecast_index,
+                            aqi_due, forecast_due)
+        finally:
+            os.close(lock_fd)  # 關閉 fd 即釋放 flock
+
+        if fetched is not None:
+            listeners = self._aqi_listeners if kind == "aqi" else self._forecast_listeners
+            self._notify(listeners, fetched)
+
+    def refresh_aqi(self, force: bool = False) -> None:
+        self._refresh("aqi", force)
+
+    def refresh_forecast(self, force: bool = False) -> None:
+        self._refresh("forecast", force)
+
+    # ===== 讀取介面（與 EnvSnapshot 相同）=====
+
+    def get_aqi_json(self) -> Optional[memoryview]:
+        """mmap 上的 memoryview，不複製整份 JSON"""
+        self.refresh_aqi()
+        return self._aqi_view()
+
+    def lookup_station(self, site: str) -> Optional[Dict]:
+        self._sync()
+        site = (site or "").strip()
+        if not site or self._rows is None:
+            return None
+        i = self._site_index.get(site)
+        if i is None:
+            i = self._site_index.get(site.split(" ")[-1])
+        if i is None:
+            return None
+
+        r = self._rows[i]
+
+        def num(v):
+            return None if math.isnan(v) else float(v)
+
+        return {
+            "sitename": self._string(r["name_off"], r["name_len"]),
+            "county": self._string(r["county_off"], r["county_len"]),
+            "publishtime": self._string(r["publish_off"], r["publish_len"]),
+            "status": self._string(r["status_off"], r["status_len"]),
+            "latitude": num(r["lat"]),
+            "longitude": num(r["lon"]),
+            "aqi": num(r["aqi"]),
+            "pm2.5": num(r["pm25"]),
+            "pm10": num(r["pm10"]),
+            "o3": num(r["o3"]),
+            "so2": num(r["so2"]),
+        }
+
+    def lookup_forecast(self, county: str) -> Optional[List[Dict]]:
+        self._sync()
+        county = normalize_county(county)
+        if county in self._forecast_cache:
+            return self._forecast_cache[county]
+        pos = self._forecast_index.get(county)
+        if not pos:
+            return None
+        base = self._sections[FORECAST_JSON][0]
+        elements = json.loads(self._mm[base + pos[0]: base + pos[0] + pos[1]])
+        self._forecast_cache[county] = elements
+        return elements
+
+    def has_forecasts(self) -> bool:
+        self._sync()
+        return bool(self._forecast_index)
+
+    def station_records(self) -> List[Dict]:
+        self._sync()
+        return [self.lookup_station(site) for site in self._site_index]
+
+    def county_names(self) -> List[str]:
+        self._sync()
+        return list(self._forecast_index)
+
+
+def make_env_snapshot(
+    aqi_fetcher: Callable[[], Dict],
+    forecast_fetcher: Callable[[], Dict[str, List[Dict]]],
+) -> EnvSnapshot:
+    """
+    SNAPSHOT_PATH 未設定時用系統暫存目錄；設成 off 或沒有 fcntl（Windows）
+    就退回單一 process 的 EnvSnapshot。
+    """
+    path = os.getenv("SNAPSHOT_PATH") or os.path.join(tempfile.gettempdir(), "breezyday-env-snapshot.bin")
+    if fcntl is None or path == "off":
+        return EnvSnapshot(aqi_fetcher, forecast_fetcher)
+    return SharedEnvSnapshot(aqi_fetcher, forecast_fetcher, path)
@@ -0,0 +1,233 @@
+# static_publisher.py
+"""
+把「同縣市每個人都一樣」的 dashboard 資料預先輸出成靜態檔，讓 nginx / CDN 直接服務。
+
+PUBLISH_DIR 底下：
+    manifest.json(.gz)              → 每個縣市目前對應的檔名（短快取），以及已退場檔案的退場時間
+    aqi/<hash>.json(.gz)            → 跟 /api/aqi 相同的全台測站資料
+    counties/<hash>.json(.gz)       → 縣市的今日預報（today-range 格式）、測站讀數、鄉鎮風險
+檔名是內容的 sha256，內容不變就不重寫，可以設成 immutable 長快取；
+.gz 是預先壓好的（nginx gzip_static on）。
+
+每次快照真的打到上游（on_aqi_refresh / on_forecast_refresh）就重新輸出，
+Flask 只剩下需要登入、每個使用者不同的 API。
+"""
+from typing import Dict, Optional
+from datetime import datetime, timezone
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from env_snapshot import EnvSnapshot, normalize_county, today_forecast
+from env_stream import station_reading
+from town_risk import TownRiskGrid
+
+MANIFEST = "manifest.json"
+# 不在 manifest 裡的舊檔保留多久（還拿著舊 manifest 的 client 不會 404）
+KEEP_OLD_SEC = 3600
+# 背景 thread 多久檢查一次快照（CDN 擋掉大部分流量後，不能再靠 request 觸發 refresh），
+# PUBLISH_INTERVAL_SEC 可覆蓋
+DEFAULT_PUBLISH_INTERVAL_SEC = 60
+
+
+def _compact(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".publish-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def _write_pair(path: str, data: bytes) -> int:
+    """寫 .json 與預壓的 .json.gz（mtime=0，同內容 → 同 bytes），回傳 gz 大小"""
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    _write_atomic(path + ".gz", gz)
+    _write_atomic(path, data)
+    return len(gz)
+
+
+def build_county_payloads(snapshot: EnvSnapshot, grid: Optional[TownRiskGrid]) -> Dict[str, Dict]:
+    """縣市 → {forecast, stations, towns}"""
+    counties: Dict[str, Dict] = {}
+
+    def entry(county: str) -> Dict:
+        return counties.setdefault(county, {
+            "county": county, "forecast": None, "stations": [], "towns": [],
+        })
+
+    for record in snapshot.station_records():
+        reading = station_reading(record)
+        if reading["county"]:
+            entry(normalize_county(reading["county"]))["stations"].append(reading)
+
+    for county in snapshot.county_names():
+        elements = snapshot.lookup_forecast(county)
+        if elements:
+            entry(county)["forecast"] = {"locationName": county, **today_forecast(elements)}
+
+    if grid is not None:
+        for town in grid.all():
+            if town["city"] in counties:
+                counties[town["city"]]["towns"].append(
+                    {k: v for k, v in town.items() if k != "city"}
+                )
+
+    for c in counties.values():
+        c["stations"].sort(key=lambda r: r["site"])
+        c["towns"].sort(key=lambda t: t["district"])
+    return counties
+
+
+class StaticPublisher:
+    def __init__(self, snapshot: EnvSnapshot, out_dir: str, grid: Optional[TownRiskGrid] = None):
+        self.snapshot = snapshot
+        self.out_dir = out_dir
+        self.grid = grid
+        # 讀快照時可能觸發另一種 refresh → callback 再進來 publish，所以用 RLock
+        self._lock = threading.RLock()
+        os.makedirs(os.path.join(out_dir, "aqi"), exist_ok=True)
+        os.makedirs(os.path.join(out_dir, "counties"), exist_ok=True)
+
+    def _put(self, subdir: str, data: bytes) -> Dict:
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        rel = f"{subdir}/{digest}.json"
+        path = os.path.join(self.out_dir, rel)
+        if os.path.exists(path) and os.path.exists(path + ".gz"):
+            gz_bytes = os.path.getsize(path + ".gz")
+        else:
+            gz_bytes = _write_pair(path, data)
+        return {"file": rel, "bytes": len(data), "gzBytes": gz_bytes}
+
+    def publish(self) -> Dict:
+        """輸出所有縣市檔與 manifest，回傳 manifest"""
+        with self._lock:
+            aqi_json = self.snapshot.get_aqi_json()
+            counties = build_county_payloads(self.snapshot, self.grid)
+            manifest = {
+                "version": self.snapshot.version,
+                "generatedAt": datetime.now(timezone.utc).isoformat(),
+                "aqi": self._put("aqi", aqi_json) if aqi_json else None,
+                "counties": {
+                    county: self._put("counties", _compact(payload))
+                    for county, payload in counties.items()
+                },
+            }
+
+            manifest["retired"] = self._prune(manifest, self._read_manifest() or {})
+            _write_pair(os.path.join(self.out_dir, MANIFEST), _compact(manifest))
+            return manifest
+
+    @staticmethod
+    def _live_files(manifest: Dict) -> set:
+        files = {c["file"] for c in (manifest.get("counties") or {}).values()}
+        if manifest.get("aqi"):
+            files.add(manifest["aqi"]["file"])
+        return files
+
+    def _prune(self, manifest: Dict, previous: Dict) -> Dict[str, float]:
+        """
+        不在新 manifest 裡的檔案記下「退場時間」（存在 manifest 的 retired），
+        退場超過 KEEP_OLD_SEC 才刪；不看檔案 mtime，內容很久沒變的檔案也有完整的保留期。
+        回傳新的 retired 表。
+        """
+        now = time.time()
+        keep = self._live_files(manifest)
+        retired = {
+            rel: at for rel, at in (previous.get("retired") or {}).items() if rel not in keep
+        }
+        for rel in self._live_files(previous) - keep:
+            retired.setdefault(rel, now)
+
+        for subdir in ("aqi", "counties"):
+            for name in os.listdir(os.path.join(self.out_dir, subdir)):
+                if name.startswith("."):
+                    continue  # 寫到一半的暫存檔
+                rel = f"{subdir}/{name[:-3] if name.endswith('.gz') else name}"
+                if rel in keep:
+                    continue
+                # manifest 不認得的檔案（例如 manifest 曾遺失）也從現在開始計時
+                retired.setdefault(rel, now)
+                if now - retired[rel] >= KEEP_OLD_SEC:
+                    os.unlink(os.path.join(self.out_dir, subdir, name))
+
+        # 兩個檔案（.json / .json.gz）都刪掉後就不用再記
+        return {
+            rel: at for rel, at in retired.items()
+            if os.path.exists(os.path.join(self.out_dir, rel))
+            or os.path.exists(os.path.join(self.out_dir, rel + ".gz"))
+        }
+
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.out_dir, MANIFEST), "rb") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def published_version(self) -> Optional[int]:
+        return (self._read_manifest() or {}).get("version")
+
+    def attach(self) -> None:
+        """快照真的打到上游後重新輸出（SharedEnvSnapshot 只有負責更新的 worker 會跑）"""
+        def on_refresh(_data) -> None:
+            try:
+                self.publish()
+            except Exception as e:
+                print("static publish 失敗:", repr(e))
+
+        self.snapshot.on_aqi_refresh(on_refresh)
+        self.snapshot.on_forecast_refresh(on_refresh)
+
+
+def start_publisher(snapshot: EnvSnapshot, out_dir: str,
+                    grid: Optional[TownRiskGrid] = None,
+                    interval_sec: Optional[int] = None) -> StaticPublisher:
+    """
+    掛上 refresh callback，並開背景 thread 定期觸發快照 refresh（過期才會真的打上游），
+    剛啟動時 manifest 還是舊版本就先補輸出一次。
+    """
+    if interval_sec is None:
+        # 呼叫時才讀環境變數（app.py 的 load_dotenv() 之後）
+        interval_sec = int(os.getenv("PUBLISH_INTERVAL_SEC", str(DEFAULT_PUBLISH_INTERVAL_SEC)))
+    publisher = StaticPublisher(snapshot, out_dir, grid)
+    publisher.attach()
+
+    def loop() -> None:
+        while True:
+            try:
+                snapshot.refresh_aqi()
+                snapshot.refresh_forecast()
+                if publisher.published_version() != snapshot.version:
+                    publisher.publish()
+            except Exception as e:
+                print("static publisher error:", repr(e))
+            time.sleep(interval_sec)
+
+    threading.Thread(target=loop, name="static-publisher", daemon=True).start()
+    return publisher
+
+
+if __name__ == "__main__":
+    # 單次輸出（例如 cron）：python static_publisher.py [輸出目錄]
+    import sys
+    import app
+
+    out = sys.argv[1] if len(sys.argv) > 1 else os.getenv("PUBLISH_DIR", "public")
+    app.env_snapshot.refresh_aqi()
+    app.env_snapshot.refresh_forecast()
+    result = StaticPublisher(app.env_snapshot, out, app.town_risk_grid).publish()
+    print(json.dumps({k: result[k] for k in ("version", "generatedAt")}, ensure_ascii=False),
+          f"{len(result['counties'])} counties")
@@ -0,0 +1,166 @@
+# town_risk.py
+"""
+鄉鎮層級的 AQI / 過敏風險格網。
+
+前端原本是「GPS → 最近鄉鎮 → 最近一個測站的 AQI」，測站之間的鄉鎮只靠單點估計。
+這裡每次 AQI 快照更新後，用所有測站對每個鄉鎮中心點做反距離加權（IDW）：
+鄉鎮 × 測站的距離矩陣用 NumPy 一次算完，結果存成 (縣市, 鄉鎮) → 估計值的 dict，查詢 O(1)。
+
+鄉鎮中心點來自 data/towns.json（可用 TOWNS_PATH 換成完整的鄉鎮清單），
+格式跟前端 useNearestStation.ts 的 TOWNS 一樣：{city, district, lat, lon}。
+"""
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import threading
+import numpy as np
+
+from env_snapshot import EnvSnapshot, normalize_county
+
+DEFAULT_TOWNS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "towns.json")
+
+EARTH_RADIUS_KM = 6371.0
+IDW_POWER = 2
+# 只用這個半徑內的測站；半徑內一個都沒有就用最近的測站（IDW_RADIUS_KM 可覆蓋）
+DEFAULT_IDW_RADIUS_KM = 25.0
+# 測站就在鄉鎮中心旁邊時避免權重爆掉
+MIN_DISTANCE_KM = 0.5
+
+
+def load_towns(path: Optional[str] = None) -> List[Dict]:
+    # 呼叫時才讀環境變數（app.py 的 load_dotenv() 之後）
+    path = path or os.getenv("TOWNS_PATH") or DEFAULT_TOWNS_PATH
+    with open(path, encoding="utf-8") as f:
+        towns = json.load(f)
+    for t in towns:
+        t["city"] = normalize_county(t["city"])
+    return towns
+
+
+def haversine_matrix(lat1: np.ndarray, lon1: np.ndarray,
+                     lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """(N,) × (M,) 度數座標 → (N, M) 公里距離矩陣"""
+    p1 = np.radians(lat1)[:, None]
+    p2 = np.radians(lat2)[None, :]
+    dlat = p2 - p1
+    dlon = np.radians(lon2)[None, :] - np.radians(lon1)[:, None]
+    a = np.sin(dlat / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def idw(dist: np.ndarray, values: np.ndarray,
+        power: float = IDW_POWER, radius_km: float = DEFAULT_IDW_RADIUS_KM) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    dist: (N, M) 距離矩陣，values: (M,) 測站數值
+    回傳 (每列的估計值, 每列用了幾個測站)
+    """
+    w = 1.0 / np.maximum(dist, MIN_DISTANCE_KM) ** power
+    w = np.where(dist <= radius_km, w, 0.0)
+    used = np.count_nonzero(w, axis=1)
+    total = w.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        est = (w @ values) / total
+
+    # 半徑內沒有測站 → 最近的測站
+    nearest = values[np.argmin(dist, axis=1)]
+    est = np.where(used > 0, est, nearest)
+    return est, np.maximum(used, 1)
+
+
+def risk_level(aqi: Optional[float]) -> str:
+    """跟 Dashboard 的 getAllergyRiskFromAqiValue 同一組切點"""
+    if aqi is None:
+        return "unknown"
+    if aqi <= 100:
+        return "low"
+    if aqi <= 150:
+        return "moderate"
+    return "dangerous"
+
+
+def _station_arrays(records: List[Dict]) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    def num(v):
+        try:
+            return float(v)
+        except (TypeError, ValueError):
+            return np.nan
+
+    rows = [
+        ((r.get("sitename") or r.get("SiteName") or ""),
+         num(r.get("latitude")), num(r.get("longitude")), num(r.get("aqi") or r.get("AQI")))
+        for r in records
+    ]
+    rows = [r for r in rows if not (np.isnan(r[1]) or np.isnan(r[2]) or np.isnan(r[3]))]
+    names = [r[0] for r in rows]
+    arr = np.array([r[1:] for r in rows], dtype=np.float64).reshape(-1, 3)
+    return names, arr[:, 0], arr[:, 1], arr[:, 2]
+
+
+class TownRiskGrid:
+    """
+    快照版本變了才重算（SharedEnvSnapshot 的其他 worker 也會看到版本變化，
+    所以每個 worker 各自算一次，不需要 listener）。
+    測站位置沒變時沿用上次的距離矩陣，只重做加權。
+    """
+
+    def __init__(self, snapshot: EnvSnapshot, towns: Optional[List[Dict]] = None,
+                 radius_km: Optional[float] = None):
+        self.snapshot = snapshot
+        self.towns = towns if towns is not None else load_towns()
+        self.radius_km = (
+            radius_km if radius_km is not None
+            else float(os.getenv("IDW_RADIUS_KM", str(DEFAULT_IDW_RADIUS_KM)))
+        )
+        self._town_lat = np.array([t["lat"] for t in self.towns], dtype=np.float64)
+        self._town_lon = np.array([t["lon"] for t in self.towns], dtype=np.float64)
+        self._version = -1
+        self._grid: Dict[Tuple[str, str], Dict] = {}
+        self._dist: Optional[np.ndarray] = None
+        self._dist_key: Optional[bytes] = None
+        self._lock = threading.Lock()
+
+    def _ensure(self) -> None:
+        self.snapshot.refresh_aqi()
+        if self.snapshot.version == self._version:
+            return
+        with self._lock:
+            if self.snapshot.version != self._version:
+                self._version = self.snapshot.version
+                self._grid = self.compute(self.snapshot.station_records())
+
+    def compute(self, records: List[Dict]) -> Dict[Tuple[str, str], Dict]:
+        names, lat, lon, aqi = _station_arrays(records)
+        if not names or not self.towns:
+            return {}
+
+        key = np.concatenate([lat, lon]).tobytes()
+        if key != self._dist_key:
+            self._dist = haversine_matrix(self._town_lat, self._town_lon, lat, lon)
+            self._dist_key = key
+        dist = self._dist
+
+        est, used = idw(dist, aqi, radius_km=self.radius_km)
+        nearest = np.argmin(dist, axis=1)
+
+        grid = {}
+        for i, t in enumerate(self.towns):
+            value = round(float(est[i]), 1)
+            j = int(nearest[i])
+            grid[(t["city"], t["district"])] = {
+                "city": t["city"],
+                "district": t["district"],
+                "aqi": value,
+                "risk": risk_level(value),
+                "stations": int(used[i]),
+                "nearestStation": names[j],
+                "nearestKm": round(float(dist[i, j]), 2),
+            }
+        return grid
+
+    def lookup(self, city: str, district: str) -> Optional[Dict]:
+        self._ensure()
+        return self._grid.get((normalize_county(city or ""), (district or "").strip()))
+
+    def all(self) -> List[Dict]:
+        self._ensure()
+        return list(self._grid.values())
@@ -0,0 +1,276 @@
+# township_forecast.py
+"""
+鄉鎮逐時預報（CWA F-D0047-089：全臺各鄉鎮市區未來 3 天）。
+
+F-C0032-001 只有縣市層級、12 小時一段的高低溫，山區 / 海邊的鄉鎮誤差很大。
+這裡把全臺約 368 個鄉鎮的逐時溫度、體感溫度、降雨機率存進 township_forecast：
+每個鄉鎮一份文件，slots 以台灣時間整點（"2025-12-11T18"）為 key。
+
+每次更新先跟資料庫裡的現值比對，只 $set 有變動的時段、$unset 太舊的時段，
+不會整份重寫（CWA 每次發布大部分時段的數值都不變）。
+查詢用 (city, district) 唯一 index，一次 find_one 拿整條曲線。
+
+用法：
+    python township_forecast.py        # 手動更新一次（可掛 cron）
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import os
+import threading
+import time
+import requests
+from pymongo import UpdateOne
+
+from env_snapshot import normalize_county
+from mongo import claim_run
+
+CWA_TOWNSHIP_URL = "https://opendata.cwa.gov.tw/api/v1/rest/datastore/F-D0047-089"
+TOWNSHIP_COLLECTION = "township_forecast"
+TAIPEI_TZ = timezone(timedelta(hours=8))
+
+# 已經過去的時段保留多久（今天稍早的溫度也要能畫出來）
+KEEP_PAST_HOURS = 24
+
+# 元素名稱（新版中文 / 舊版代碼）→ (欄位, ElementValue 裡的 key)
+ELEMENTS = {
+    "溫度": ("temp", "Temperature"),
+    "T": ("temp", "value"),
+    "體感溫度": ("feelsLike", "ApparentTemperature"),
+    "AT": ("feelsLike", "value"),
+    "3小時降雨機率": ("pop", "ProbabilityOfPrecipitation"),
+    "PoP6h": ("pop", "value"),
+}
+FIELDS = ("temp", "feelsLike", "pop")
+
+TownKey = Tuple[str, str]
+Slots = Dict[str, Dict[str, float]]
+
+
+def _get(d: Dict, *keys):
+    """新版 API 是大寫開頭（Locations / LocationName），舊版是小寫"""
+    for k in keys:
+        if k in d:
+            return d[k]
+    return None
+
+
+def _num(v) -> Optional[float]:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_time(s: str) -> Optional[datetime]:
+    """'2025-12-11T18:00:00+08:00' / '2025-12-11 18:00:00' → naive 台灣時間"""
+    if not s:
+        return None
+    try:
+        return datetime.fromisoformat(s[:19])
+    except ValueError:
+        return None
+
+
+def slot_key(local_ts: datetime) -> str:
+    return local_ts.strftime("%Y-%m-%dT%H")
+
+
+def _time_slot(s: str) -> Optional[str]:
+    """時間字串直接切出時段 key（全國資料約 8 萬個時間點，不逐一 parse 成 datetime）"""
+    if len(s) >= 13 and s[4] == "-" and s[7] == "-" and s[10] in "T " and s[11:13].isdigit():
+        return f"{s[:10]}T{s[11:13]}"
+    return None
+
+
+def fetch_township_payload(api_key: str) -> Dict:
+    resp = requests.get(
+        CWA_TOWNSHIP_URL,
+        params={"Authorization": api_key, "format": "JSON"},
+        timeout=30,
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+def _element_slots(element: Dict, field: str, value_key: str, slots: Slots) -> None:
+    for t in _get(element, "Time", "time") or []:
+        values = _get(t, "ElementValue", "elementValue") or []
+        value = _num(_get(values[0], value_key, "value")) if values else None
+        if value is None:
+            continue
+
+        point = _time_slot(_get(t, "DataTime", "dataTime") or "")
+        if point is not None:
+            slots.setdefault(point, {})[field] = value
+            continue
+
+        # 區間型（降雨機率）：區間內每個整點都填同一個值
+        start = _parse_time(_get(t, "StartTime", "startTime") or "")
+        end = _parse_time(_get(t, "EndTime", "endTime") or "")
+        if start is None or end is None:
+            continue
+        ts = start
+        while ts < end:
+            slots.setdefault(slot_key(ts), {})[field] = value
+            ts += timedelta(hours=1)
+
+
+def parse_township_payload(payload: Dict) -> Dict[TownKey, Dict]:
+    """F-D0047 → {(縣市, 鄉鎮): {"geocode", "lat", "lon", "slots": {時段: {temp, feelsLike, pop}}}}"""
+    records = payload.get("records") or {}
+    towns: Dict[TownKey, Dict] = {}
+    for county in _get(records, "Locations", "locations") or []:
+        city = normalize_county(_get(county, "LocationsName", "locationsName") or "")
+        for loc in _get(county, "Location", "location") or []:
+            district = _get(loc, "LocationName", "locationName")
+            if not city or not district:
+                continue
+            slots: Slots = {}
+            for el in _get(loc, "WeatherElement", "weatherElement") or []:
+                spec = ELEMENTS.get(_get(el, "ElementName", "elementName"))
+                if spec:
+                    _element_slots(el, spec[0], spec[1], slots)
+            towns[(city, district)] = {
+                "geocode": _get(loc, "Geocode", "geocode"),
+                "lat": _num(_get(loc, "Latitude", "lat")),
+                "lon": _num(_get(loc, "Longitude", "lon")),
+                "slots": slots,
+            }
+    return towns
+
+
+def ensure_township_indexes(col) -> None:
+    col.create_index([("city", 1), ("district", 1)], unique=True)
+
+
+def load_state(col) -> Dict[TownKey, Slots]:
+    """資料庫目前的時段值（diff 的基準）"""
+    return {
+        (doc["city"], doc["district"]): doc.get("slots") or {}
+        for doc in col.find({}, {"_id": 0, "city": 1, "district": 1, "slots": 1})
+    }
+
+
+def plan_updates(
+    towns: Dict[TownKey, Dict],
+    state: Dict[TownKey, Slots],
+    now: Optional[datetime] = None,
+) -> Tuple[List[UpdateOne], Dict[str, int]]:
+    """新資料 vs 現值 → 只含變動時段的 UpdateOne，以及統計"""
+    now = now or datetime.now(TAIPEI_TZ).replace(tzinfo=None)
+    cutoff = slot_key(now - timedelta(hours=KEEP_PAST_HOURS))
+    stats = {"towns": len(towns), "changedTowns": 0, "setFields": 0, "removedSlots": 0}
+    ops = []
+
+    for (city, district), town in towns.items():
+        old = state.get((city, district))
+        sets = {}
+        for key, values in town["slots"].items():
+            if key < cutoff:
+                continue
+            old_values = (old or {}).get(key) or {}
+            for field, value in values.items():
+                if old_values.get(field) != value:
+                    sets[f"slots.{key}.{field}"] = value
+        unsets = {f"slots.{key}": "" for key in (old or {}) if key < cutoff}
+
+        if old is not None and not sets and not unsets:
+            continue
+
+        update = {"$set": {**sets, "updatedAt": datetime.utcnow()}}
+        if old is None:
+            update["$set"].update(geocode=town["geocode"], lat=town["lat"], lon=town["lon"])
+        if unsets:
+            update["$unset"] = unsets
+        ops.append(UpdateOne({"city": city, "district": district}, update, upsert=True))
+        stats["changedTowns"] += 1
+        stats["setFields"] += len(sets)
+        stats["removedSlots"] += len(unsets)
+
+    return ops, stats
+
+
+def ingest_township_payload(col, payload: Dict, now: Optional[datetime] = None) -> Dict[str, int]:
+    towns = parse_township_payload(payload)
+    ops, stats = plan_updates(towns, load_state(col), now)
+    if ops:
+        col.bulk_write(ops, ordered=False)
+    return stats
+
+
+def refresh_township_forecast(col, api_key: str) -> Dict[str, int]:
+    return ingest_township_payload(col, fetch_township_payload(api_key))
+
+
+def start_township_scheduler(db, api_key: str, interval_sec: int) -> threading.Thread:
+    """背景 thread：每 interval_sec 秒更新一次（多個 worker 只有一個實際執行）"""
+    def loop():
+        while True:
+            try:
+                if claim_run(db["analytics_runs"], "township_forecast", interval_sec):
+                    stats = refresh_township_forecast(db[TOWNSHIP_COLLECTION], api_key)
+                    print("township forecast:", stats)
+            except Exception as e:
+                print("township forecast error:", repr(e))
+            time.sleep(min(interval_sec, 300))
+
+    t = threading.Thread(target=loop, name="township-forecast", daemon=True)
+    t.start()
+    return t
+
+
+# ========== 查詢 ==========
+
+def query_hourly(
+    col,
+    city: str,
+    district: str,
+    start: Optional[datetime] = None,
+    hours: int = 48,
+) -> Optional[List[Dict]]:
+    """(縣市, 鄉鎮) 從 start（台灣時間，預設現在這個小時）起的逐時曲線；鄉鎮不存在回 None"""
+    doc = col.find_one(
+        {"city": normalize_county(city), "district": district.strip()},
+        {"_id": 0, "slots": 1},
+    )
+    if doc is None:
+        return None
+
+    start = start or datetime.now(TAIPEI_TZ).replace(tzinfo=None)
+    first = slot_key(start)
+    slots = doc.get("slots") or {}
+    keys = sorted(k for k in slots if k >= first)[:hours]
+    return [
+        {
+            "time": f"{k}:00:00+08:00",
+            **{f: slots[k].get(f) for f in FIELDS},
+        }
+        for k in keys
+    ]
+
+
+def summarize_hours(points: Iterable[Dict], first_hour: int = 6, last_hour: int = 21) -> Dict:
+    """白天時段（預設 06–21 時）的高低溫與最大降雨機率，給穿搭建議用"""
+    temps, pops = [], []
+    for p in points:
+        hour = int(p["time"][11:13])
+        if first_hour <= hour <= last_hour:
+            if p.get("temp") is not None:
+                temps.append(p["temp"])
+            if p.get("pop") is not None:
+                pops.append(p["pop"])
+    return {
+        "tempMin": min(temps) if temps else None,
+        "tempMax": max(temps) if temps else None,
+        "rainPop": max(pops) if pops else None,
+    }
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_URI"))["BreezyDay"]
+    ensure_township_indexes(db[TOWNSHIP_COLLECTION])
+    print(refresh_township_forecast(db[TOWNSHIP_COLLECTION], os.getenv("CWA_API_KEY")))
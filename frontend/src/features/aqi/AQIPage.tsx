@@ -87,11 +87,31 @@ const AQIPage: React.FC<AQIPageProps> = ({ initialMode, onNavigate }) => {
     }
   };
 
-  // 首次載入 + 每 5 分鐘更新一次
+  // 首次載入，之後由後端 SSE 推送有變動的測站（不再定時重抓）
   useEffect(() => {
     loadData(true);
-    const id = setInterval(() => loadData(false), 5 * 60 * 1000);
-    return () => clearInterval(id);
+
+    const es = new EventSource(`${API_BASE_URL}/api/stream?stations=*`);
+    es.addEventListener("station", (e) => {
+      const r = JSON.parse((e as MessageEvent).data);
+      const patch = (row: StationRow): StationRow =>
+        row.site === r.site
+          ? {
+              ...row,
+              aqi: r.aqi != null ? String(r.aqi) : "",
+              pm25: r.pm25,
+              pm10: r.pm10,
+              o3: r.o3,
+              so2: r.so2,
+              status: r.status || row.status,
+              publishTime: r.publishTime || row.publishTime,
+            }
+          : row;
+      setRows((prev) => prev.map(patch));
+      setWatchedStations((prev) => prev.map(patch));
+      setCurrentStation((prev) => (prev ? patch(prev) : prev));
+    });
+    return () => es.close();
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
@@ -45,6 +45,8 @@ export function useNearestStation() {
   const [coords, setCoords] = useState<{ lat: number; lon: number } | null>(
     null
   );
+  // 到最近鄉鎮中心點的距離（公里）；TOWNS 沒涵蓋的地方會很遠
+  const [distanceKm, setDistanceKm] = useState<number | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
 
@@ -64,6 +66,7 @@ export function useNearestStation() {
 
       setCity(nearest.city);
       setDistrict(nearest.district);
+      setDistanceKm(bestDist);
     },
     []
   );
@@ -107,6 +110,7 @@ export function useNearestStation() {
   return {
     city,
     district,
+    distanceKm,
     lat: coords?.lat,
     lon: coords?.lon,
     loading,
@@ -5,6 +5,8 @@ import { useAuth } from "../context/AuthContext";
 import "../styles/Dashboard.css";
 import { getAqiInfo, findNearestStation } from "../features/aqi/aqiUtils";
 import type { StationRow } from "../features/aqi/aqiTypes";
+import { fetchStaticAqi, fetchStaticCounty } from "../services/staticSnapshot";
+import { useNearestStation } from "../hooks/useNearestStation";
 import {
   SparklesIcon,
   ExclamationTriangleIcon,
@@ -32,6 +34,8 @@ const API_BASE_URL =
   import.meta.env.VITE_API_BASE_URL || "http://localhost:5000";
 const AQI_API_URL = `${API_BASE_URL}/api/aqi`;
 const WEATHER_TODAY_URL = `${API_BASE_URL}/api/weather/today-range`;
+// 離最近的鄉鎮中心點超過這個距離就當作不在涵蓋範圍，不送鄉鎮
+const MAX_TOWN_DISTANCE_KM = 10;
 
 // 依照 AQI label 決定用哪個顏色 class
 function mapAqiLabelToClass(label: string | null): string {
@@ -84,6 +88,19 @@ function getAllergyRiskClass(risk: AllergyRisk): string {
 
 export default function Dashboard({ onNavigate }: DashboardProps) {
   const { token } = useAuth();
+  // 所在鄉鎮：穿搭建議改用鄉鎮逐時預報
+  const {
+    city: townCity,
+    district: townDistrict,
+    distanceKm: townDistanceKm,
+    loading: townLoading,
+    error: townError,
+  } = useNearestStation();
+  // GPS 失敗（預設中正區）或離最近鄉鎮太遠時不用鄉鎮預報
+  const townUsable =
+    !townError &&
+    townDistanceKm !== null &&
+    townDistanceKm <= MAX_TOWN_DISTANCE_KM;
 
   const today = useMemo(
     () =>
@@ -113,6 +130,8 @@ export default function Dashboard({ onNavigate }: DashboardProps) {
   // 今日降雨機率 + 天氣敘述
   const [rainPop, setRainPop] = useState<number | null>(null);
   const [weatherDesc, setWeatherDesc] = useState<string>("");
+  // 預報實際用的縣市（後端用來確認鄉鎮是不是同一個縣市）
+  const [forecastCounty, setForecastCounty] = useState<string | null>(null);
 
   //  AI Allergy Tips（Gemini)
   const [aiTips, setAiTips] = useState<string[]>([]);
@@ -134,11 +153,8 @@ export default function Dashboard({ onNavigate }: DashboardProps) {
     maxT: number | null,
     forceRefresh: boolean = false
   ) => {
-    const apiKey = localStorage.getItem("geminiApiKey");
-    if (!apiKey) {
-      console.warn("No Gemini API key found in localStorage");
-      return;
-    }
+    // 沒有自己的 key 也照送：後端有 key pool / 體感模型可以處理
+    const apiKey = localStorage.getItem("geminiApiKey") || undefined;
     if (!token) {
       console.warn("No auth token, skip AI tips");
       return;
@@ -186,11 +202,8 @@ export default function Dashboard({ onNavigate }: DashboardProps) {
     aqi: number | null,
     forceRefresh: boolean = false
   ) => {
-    const apiKey = localStorage.getItem("geminiApiKey");
-    if (!apiKey) {
-      console.warn("No Gemini API key found in localStorage (outfit)");
-      return;
-    }
+    // 沒有自己的 key 也照送：後端有 key pool / 體感模型可以處理
+    const apiKey = localStorage.getItem("geminiApiKey") || undefined;
     if (!token) {
       console.warn("No auth token, skip AI outfit");
       return;
@@ -211,6 +224,9 @@ export default function Dashboard({ onNavigate }: DashboardProps) {
             rainPop: rain,
             weatherDesc: desc,
             aqi,
+            county: forecastCounty,
+            city: townUsable ? townCity : null,
+            district: townUsable ? townDistrict : null,
           },
           forceRefresh,
         }),
@@ -288,7 +304,19 @@ export default function Dashboard({ onNavigate }: DashboardProps) {
 
     // 呼叫後端 F-C0032-001 包裝的今日高低溫 API
     const loadTempByLocation = async (locationName: string) => {
+      setForecastCounty(locationName);
       try {
+        // 有 CDN 靜態快照就先用，不必經過 Flask
+        const county = await fetchStaticCounty(locationName);
+        if (county?.forecast) {
+          setTempMin(county.forecast.minTemp);
+          setTempMax(county.forecast.maxTemp);
+          setTempDiff(county.forecast.tempDiff);
+          setRainPop(county.forecast.pop12h);
+          setWeatherDesc(county.forecast.weatherDesc || "");
+          return;
+        }
+
         const res = await fetch(
           `${WEATHER_TODAY_URL}?locationName=${encodeURIComponent(
             locationName
@@ -318,9 +346,12 @@ export default function Dashboard({ onNavigate }: DashboardProps) {
 
     const loadEnv = async () => {
       try {
-        const res = await fetch(AQI_API_URL, { credentials: "include" });
-        if (!res.ok) throw new Error(`HTTP ${res.status}`);
-        const data = await res.json();
+        let data = await fetchStaticAqi();
+        if (!data) {
+          const res = await fetch(AQI_API_URL, { credentials: "include" });
+          if (!res.ok) throw new Error(`HTTP ${res.status}`);
+          data = await res.json();
+        }
 
         const records: any[] = data?.records ?? [];
         const rows = mapToRows(records);
@@ -398,11 +429,13 @@ export default function Dashboard({ onNavigate }: DashboardProps) {
   }, [aqiValue, tempMin, tempMax]);
 
   // Outfit：當三個主要環境值載入後就呼叫
+  // （等鄉鎮定位完成，第一次呼叫就帶 city / district，不然會先 cache 住縣市層級的建議）
   useEffect(() => {
     if (
       aqiValue === null ||
       tempMin === null ||
-      tempMax === null
+      tempMax === null ||
+      townLoading
     ) {
       return;
     }
@@ -414,7 +447,8 @@ export default function Dashboard({ onNavigate }: DashboardProps) {
       weatherDesc,   
       aqiValue
     );
-  }, [aqiValue, tempMin, tempMax]);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [aqiValue, tempMin, tempMax, townLoading]);
   const handleRefreshAllergy = () => {
     if (aqiValue === null || tempMin === null || tempMax === null) return;
     loadAiAllergyTips(aqiValue, tempMin, tempMax, true);
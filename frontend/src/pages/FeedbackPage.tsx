@@ -6,7 +6,7 @@ import "../styles/Feedback.css";
 // 共用 AQI 工具 & 型別
 import { findNearestStation, getAqiInfo } from "../features/aqi/aqiUtils";
 import type { StationRow } from "../features/aqi/aqiTypes";
-import { SparklesIcon, SunIcon } from "@heroicons/react/24/outline";
+import { SparklesIcon } from "@heroicons/react/24/outline";
 //type Props = {};
 
 export default function FeedbackPage() {
@@ -21,14 +21,10 @@ export default function FeedbackPage() {
     day: "2-digit",
   });
   // ===== Environment (AQI) =====
+  // 只用來顯示與選測站；送出時後端依測站 / 縣市自己從快照算環境欄位
   const [envAqi, setEnvAqi] = useState<number | null>(null);
   const [envAqiSite, setEnvAqiSite] = useState<string>("");
 
-  // 今天高低溫（來自 F-C0032-001）
-  const [envMaxTemp, setEnvMaxTemp] = useState<number | null>(null);
-  const [envMinTemp, setEnvMinTemp] = useState<number | null>(null);
-  const [envTempDiff, setEnvTempDiff] = useState<number | null>(null);
-
   // ===== Outfit (structured) =====
   const [top, setTop] = useState("");
   const [bottom, setBottom] = useState("");
@@ -134,42 +130,6 @@ export default function FeedbackPage() {
     loadEnv();
   }, [API_BASE]);
 
-  // ============================
-  // 用 AQI 的縣市去抓今天高低溫（F-C0032-001）
-  // ============================
-  useEffect(() => {
-    if (!envAqiSite) return;
-
-    const county = envAqiSite.split(" ")[0] || envAqiSite;
-
-    async function loadTodayRange() {
-      try {
-        const resp = await fetch(
-          `${API_BASE}/api/weather/today-range?locationName=${encodeURIComponent(
-            county
-          )}`
-        );
-        const json = await resp.json();
-
-        if (json.success) {
-          setEnvMaxTemp(
-            typeof json.maxTemp === "number" ? json.maxTemp : null
-          );
-          setEnvMinTemp(
-            typeof json.minTemp === "number" ? json.minTemp : null
-          );
-          setEnvTempDiff(
-            typeof json.tempDiff === "number" ? json.tempDiff : null
-          );
-        }
-      } catch (e) {
-        console.error("Failed to load today temp range", e);
-      }
-    }
-
-    loadTodayRange();
-  }, [API_BASE, envAqiSite]);
-
   // ============================
   // Submit
   // ============================
@@ -189,12 +149,10 @@ export default function FeedbackPage() {
         allergySymptoms,
         allergyMed,
         recommendationRating,
-        envAqi,
+        // 「縣市 站名」；後端找不到測站時用 locationName 查縣市預報
         envAqiSite,
+        locationName: envAqiSite.split(" ")[0] || "",
         feedbackDate: todayStr,
-        envMaxTemp,
-        envMinTemp,
-        envTempDiff,
       };
 
       const resp = await fetch(`${API_BASE}/api/feedback`, {
@@ -254,32 +212,6 @@ export default function FeedbackPage() {
               )}
             </div>
 
-            {/* Temperature */}
-            <div className="form-field">
-              <label className="feedback-label">
-                <SunIcon className="form-icon" aria-hidden="true" /> Today's Temperature
-              </label>
-
-              {envMaxTemp !== null ? (
-                <div className="info-card">
-                  <div className="info-card-top-row">
-                    <strong>High / Low</strong>
-                    <span className="small-label">{todayStr}</span>
-                  </div>
-
-                  <div className="info-card-temp-values">
-                    Max: <strong>{envMaxTemp}°C</strong>
-                    <br />
-                    Min: <strong>{envMinTemp}°C</strong>
-                    <br />
-                    Δ Temp: <strong>{envTempDiff}°C</strong>
-                  </div>
-                </div>
-              ) : (
-                <div className="small-label">Loading temperature...</div>
-              )}
-            </div>
-
             {/* Outfit */}
             <div className="form-field">
               <label className="feedback-question">
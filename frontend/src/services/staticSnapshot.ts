@@ -0,0 +1,94 @@
+// src/services/staticSnapshot.ts
+// 後端 static_publisher.py 輸出的靜態快照（nginx / CDN 直接服務）
+// 沒設定 VITE_STATIC_BASE_URL 時回傳 null，呼叫端改打 Flask API
+
+const STATIC_BASE_URL = (import.meta.env.VITE_STATIC_BASE_URL || "").replace(/\/$/, "");
+
+type ManifestEntry = { file: string; bytes: number; gzBytes: number };
+
+type Manifest = {
+  version: number;
+  generatedAt: string;
+  aqi: ManifestEntry | null;
+  counties: Record<string, ManifestEntry>;
+};
+
+export type CountySnapshot = {
+  county: string;
+  forecast: {
+    locationName: string;
+    maxTemp: number | null;
+    minTemp: number | null;
+    tempDiff: number | null;
+    pop12h: number | null;
+    weatherDesc: string;
+  } | null;
+  stations: {
+    site: string;
+    county: string;
+    publishTime: string;
+    aqi: number | null;
+    pm25: number | null;
+    pm10: number | null;
+    o3: number | null;
+    so2: number | null;
+    status: string;
+  }[];
+  towns: {
+    district: string;
+    aqi: number;
+    risk: "low" | "moderate" | "dangerous" | "unknown";
+    stations: number;
+    nearestStation: string;
+    nearestKm: number;
+  }[];
+};
+
+// manifest 很小而且會變，每次載入頁面重新驗證一次；內容檔名含 hash，可以長快取
+let manifestPromise: Promise<Manifest | null> | null = null;
+
+async function fetchManifest(): Promise<Manifest | null> {
+  try {
+    const res = await fetch(`${STATIC_BASE_URL}/manifest.json`, { cache: "no-cache" });
+    if (!res.ok) return null;
+    return await res.json();
+  } catch {
+    return null;
+  }
+}
+
+// 同一次頁面載入的 AQI / 縣市查詢共用同一份 manifest
+function loadManifest(): Promise<Manifest | null> {
+  if (!STATIC_BASE_URL) return Promise.resolve(null);
+  if (!manifestPromise) {
+    manifestPromise = fetchManifest().then((m) => {
+      if (!m) manifestPromise = null; // 失敗的話下次再試
+      return m;
+    });
+  }
+  return manifestPromise;
+}
+
+async function loadFile<T>(entry: ManifestEntry | null | undefined): Promise<T | null> {
+  if (!entry) return null;
+  try {
+    const res = await fetch(`${STATIC_BASE_URL}/${entry.file}`);
+    if (!res.ok) return null;
+    return await res.json();
+  } catch {
+    return null;
+  }
+}
+
+/** 跟 /api/aqi 相同格式的全台測站資料 */
+export async function fetchStaticAqi(): Promise<any | null> {
+  const manifest = await loadManifest();
+  return loadFile(manifest?.aqi);
+}
+
+/** 縣市的今日預報 / 測站 / 鄉鎮風險 */
+export async function fetchStaticCounty(county: string): Promise<CountySnapshot | null> {
+  const manifest = await loadManifest();
+  const name = county.replace(/台/g, "臺");
+  return loadFile<CountySnapshot>(manifest?.counties[name]);
+}